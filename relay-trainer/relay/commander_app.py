@@ -1,65 +1,183 @@
 from __future__ import annotations
 
-import json
+import logging
 import os
 import secrets
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from threading import Lock
 
-from fastapi import FastAPI, Header, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 
+from relay.commander_store import open_state_store
+from relay.common.metrics import CONTENT_TYPE, Registry
 from relay.common.schema import (
     AcquireLeaseRequest,
     AcquireLeaseResponse,
     ActiveLease,
-    CommanderState,
+    HeartbeatRequest,
     JobReportRequest,
     RenewLeaseRequest,
+    RunSpec,
     RunStatus,
     WorkerConfig,
 )
+from relay.notifier import LeaseNotifier
+from relay.scheduler import (
+    RELEASING_STATUSES,
+    TERMINAL_STATUSES,
+    lease_live,
+    pick_run,
+    release_expired,
+    release_lease,
+)
 
 STATE_PATH = Path(os.getenv("RELAY_COMMANDER_STATE", "./commander_state.json"))
+STATE_BACKEND = os.getenv("RELAY_COMMANDER_BACKEND") or None
 LEASE_SECONDS = int(os.getenv("RELAY_LEASE_SECONDS", "3600"))
 SHARED_SECRET = os.getenv("RELAY_SHARED_SECRET", "")
+MAX_ACQUIRE_WAIT_SEC = float(os.getenv("RELAY_MAX_ACQUIRE_WAIT_SEC", "60"))
+# A lease whose holder has not been heard from for this long is released by the sweeper (0 = off).
+LIVENESS_TIMEOUT_SEC = float(os.getenv("RELAY_LIVENESS_TIMEOUT_SEC", "180"))
+SWEEP_INTERVAL_SEC = float(os.getenv("RELAY_SWEEP_INTERVAL_SEC", "5"))
+
+logger = logging.getLogger("relay.commander")
+
+store = open_state_store(STATE_PATH, STATE_BACKEND)
+# Lease expiry as last written to the store; renewals only persist once it falls half a lease behind.
+_persisted_expiry: dict[str, datetime] = {}
+notifier = LeaseNotifier()
+# Monotonic time each leased run was last heard from (acquire, renew, heartbeat, report).
+_last_seen: dict[str, float] = {}
+_sweeper_stop = threading.Event()
+# Monotonic time a run's lease was dropped without the run finishing; cleared by the next grant.
+_released_at: dict[str, float] = {}
+# Last (step, monotonic time) reported per run, for the step-rate gauge.
+_last_step: dict[str, tuple[int, float]] = {}
+
+metrics = Registry()
+REQUEST_SECONDS = metrics.histogram(
+    "relay_commander_request_duration_seconds", "HTTP request latency by route", ("route", "method", "code")
+)
+LOCK_WAIT_SECONDS = metrics.histogram("relay_commander_lock_wait_seconds", "Time spent waiting for the state lock")
+SAVE_SECONDS = metrics.histogram("relay_commander_state_save_duration_seconds", "State store save duration")
+metrics.gauge("relay_commander_state_size_bytes", "On-disk size of the state store", func=lambda: store.size_bytes())
+metrics.gauge("relay_commander_active_leases", "Leases currently held", func=lambda: len(store.state.leases))
+HANDOFFS = metrics.counter("relay_commander_handoffs_total", "Leases re-granted after the previous holder left")
+HANDOFF_SECONDS = metrics.histogram(
+    "relay_commander_handoff_duration_seconds",
+    "Time from a lease being released to the run being leased again",
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0),
+)
+RUN_STEP = metrics.gauge("relay_run_step", "Last reported training step", ("run_id",))
+RUN_STEP_RATE = metrics.gauge("relay_run_step_rate", "Training steps per second between reports", ("run_id",))
 
 
-class StateStore:
-    def __init__(self, path: Path):
-        self.path = path
-        self.lock = Lock()
-        self.state = CommanderState()
-        self._load()
-
-    def _load(self) -> None:
-        if not self.path.exists():
-            return
-        raw = json.loads(self.path.read_text(encoding="utf-8"))
-        self.state = CommanderState.model_validate(raw)
-
-    def save(self) -> None:
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        self.path.write_text(self.state.model_dump_json(indent=2), encoding="utf-8")
-
-    def with_lock(self):
-        return self.lock
-
-
-store = StateStore(STATE_PATH)
-app = FastAPI(title="Relay Commander", version="0.1.0")
+@contextmanager
+def _locked():
+    started = time.perf_counter()
+    with store.with_lock():
+        LOCK_WAIT_SECONDS.observe(time.perf_counter() - started)
+        yield
+    # Acknowledge only once this request's writes are durable, without holding the lock.
+    store.wait_durable()
+
+
+def _save(run_ids: list[str] | None = None) -> None:
+    started = time.perf_counter()
+    store.save(run_ids)
+    SAVE_SECONDS.observe(time.perf_counter() - started)
+
+
+def _note_step(run_id: str, step: int) -> None:
+    mono = time.monotonic()
+    prev = _last_step.get(run_id)
+    if prev is not None and step > prev[0] and mono > prev[1]:
+        RUN_STEP_RATE.set((step - prev[0]) / (mono - prev[1]), run_id=run_id)
+    if prev is None or step != prev[0]:
+        _last_step[run_id] = (step, mono)
+    RUN_STEP.set(step, run_id=run_id)
+
+
+def _forget_step(run_id: str) -> None:
+    # Finished runs drop out of the scrape, so label sets do not pile up over the commander's life.
+    _last_step.pop(run_id, None)
+    RUN_STEP.remove(run_id=run_id)
+    RUN_STEP_RATE.remove(run_id=run_id)
+
+
+def sweep_leases() -> list[str]:
+    """Release expired leases and leases whose worker went silent; wake long-polling acquirers."""
+    now, mono = now_utc(), time.monotonic()
+    with _locked():
+        released = []
+        for run_id, lease in list(store.state.leases.items()):
+            # Leases loaded at startup get a full liveness window before they can go stale.
+            silent = mono - _last_seen.setdefault(run_id, mono)
+            if lease.expires_at <= now:
+                reason = "lease expired"
+            elif LIVENESS_TIMEOUT_SEC > 0 and silent > LIVENESS_TIMEOUT_SEC:
+                reason = f"no heartbeat for {int(silent)}s"
+            else:
+                continue
+            release_lease(store.state, run_id, now)
+            _persisted_expiry.pop(run_id, None)
+            _last_seen.pop(run_id, None)
+            _released_at[run_id] = mono
+            status = store.state.run_status[run_id]
+            status.status = "PREEMPTED"
+            status.msg = reason
+            status.updated_at = now
+            logger.warning("lease_expired run_id=%s worker_id=%s reason=%s", run_id, lease.worker_id, reason)
+            released.append(run_id)
+        if released:
+            _save(released)
+    if released:
+        notifier.notify()
+    return released
+
+
+def _sweep_loop() -> None:
+    while not _sweeper_stop.wait(SWEEP_INTERVAL_SEC):
+        try:
+            sweep_leases()
+        except Exception:
+            logger.exception("lease sweep failed")
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    _sweeper_stop.clear()
+    sweeper = threading.Thread(target=_sweep_loop, name="relay-lease-sweeper", daemon=True)
+    sweeper.start()
+    yield
+    _sweeper_stop.set()
+    sweeper.join()
+    store.close()
+
+
+app = FastAPI(title="Relay Commander", version="0.1.0", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def _observe_request(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - started, route=route, method=request.method, code=str(response.status_code)
+    )
+    return response
 
 
 def now_utc() -> datetime:
     return datetime.now(timezone.utc)
 
 
-def _lease_expired(lease: ActiveLease | None) -> bool:
-    if lease is None:
-        return True
-    return lease.expires_at <= now_utc()
-
-
 def _assert_secret(header_secret: str | None) -> None:
     if not SHARED_SECRET:
         return
@@ -68,77 +186,193 @@ def _assert_secret(header_secret: str | None) -> None:
 
 
 def _default_config(run_id: str) -> WorkerConfig:
+    spec = store.state.runs.get(run_id)
     return WorkerConfig(
         l1_root=os.getenv("RELAY_L1_ROOT", "/mnt/relay"),
         run_id=run_id,
+        mode=spec.mode if spec else None,
         ckpt_interval_sec=int(os.getenv("RELAY_CKPT_INTERVAL", "600")),
         ckpt_keep_last_n=int(os.getenv("RELAY_CKPT_KEEP_LAST_N", "3")),
         hf_sync_interval_sec=int(os.getenv("RELAY_HF_SYNC_INTERVAL", str(4 * 3600))),
-        hf_repo=os.getenv("RELAY_HF_REPO") or None,
+        hf_repo=(spec.hf_repo if spec else None) or os.getenv("RELAY_HF_REPO") or None,
         hf_push_on_improve=os.getenv("RELAY_HF_PUSH_ON_IMPROVE", "false").lower() == "true",
     )
 
 
+def _find_lease(run_id: str | None, lease_token: str) -> ActiveLease | None:
+    if run_id is not None:
+        return store.state.leases.get(run_id)
+    for lease in store.state.leases.values():
+        if lease.lease_token == lease_token:
+            return lease
+    return None
+
+
+def _extend_lease(lease: ActiveLease, now: datetime) -> bool:
+    """Push the lease deadline out in memory; return True when the store copy is due a refresh."""
+    lease.expires_at = now + timedelta(seconds=LEASE_SECONDS)
+    persisted = _persisted_expiry.get(lease.run_id)
+    if persisted is None or (lease.expires_at - persisted).total_seconds() >= LEASE_SECONDS / 2:
+        _persisted_expiry[lease.run_id] = lease.expires_at
+        return True
+    return False
+
+
 @app.get("/api/health")
 def health() -> dict:
     return {"ok": True}
 
 
-@app.post("/api/lease/acquire", response_model=AcquireLeaseResponse)
-def acquire_lease(req: AcquireLeaseRequest, x_relay_secret: str | None = Header(default=None)) -> AcquireLeaseResponse:
+@app.get("/metrics")
+def prometheus_metrics() -> PlainTextResponse:
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
+
+
+@app.post("/api/runs/submit")
+def submit_run(spec: RunSpec, x_relay_secret: str | None = Header(default=None)) -> dict:
     _assert_secret(x_relay_secret)
-    with store.with_lock():
-        lease = store.state.active_lease
-        if not _lease_expired(lease):
-            if req.force:
-                store.state.active_lease = None
-            else:
-                return AcquireLeaseResponse(status="denied", reason="active lease exists")
+    with _locked():
+        store.state.runs[spec.run_id] = spec
+        status = store.state.run_status.setdefault(spec.run_id, RunStatus(run_id=spec.run_id))
+        if not lease_live(store.state, spec.run_id, now_utc()):
+            status.status = "QUEUED"
+            status.updated_at = now_utc()
+        _save([spec.run_id])
+    notifier.notify()
+    return {"ok": True}
 
+
+def _next_expiry_in(now: datetime) -> float | None:
+    """Seconds until the earliest live lease runs out; call with the state lock held."""
+    deadlines = [lease.expires_at for lease in store.state.leases.values()]
+    if not deadlines:
+        return None
+    return max(0.0, (min(deadlines) - now).total_seconds())
+
+
+@app.post("/api/lease/acquire", response_model=AcquireLeaseResponse)
+async def acquire_lease(
+    req: AcquireLeaseRequest, x_relay_secret: str | None = Header(default=None)
+) -> AcquireLeaseResponse:
+    """Grant a lease, or with `wait_sec` > 0 long-poll until one is free or the wait runs out."""
+    _assert_secret(x_relay_secret)
+    deadline = time.monotonic() + min(req.wait_sec, MAX_ACQUIRE_WAIT_SEC)
+    while True:
+        seq = notifier.seq
+        resp, expiry = await run_in_threadpool(_try_acquire, req)
+        remaining = deadline - time.monotonic()
+        if resp.status == "granted" or remaining <= 0:
+            return resp
+        # Also wake when the earliest live lease runs out, in case nothing else notifies.
+        await notifier.wait(seq, remaining if expiry is None else min(remaining, expiry + 0.01))
+
+
+def _try_acquire(req: AcquireLeaseRequest) -> tuple[AcquireLeaseResponse, float | None]:
+    """Try to grant a lease; also return when the next live lease expires, read under the same lock."""
+    now = now_utc()
+    with _locked():
+        changed = release_expired(store.state, now)
+        for expired in changed:
+            _released_at[expired] = time.monotonic()
+        run_id = req.run_id or pick_run(store.state, req.cap, now)
+        if run_id is None:
+            _save(changed)
+            return AcquireLeaseResponse(status="denied", reason="no runnable run"), _next_expiry_in(now)
+        if lease_live(store.state, run_id, now):
+            if not req.force:
+                _save(changed)
+                denied = AcquireLeaseResponse(status="denied", run_id=run_id, reason="active lease exists")
+                return denied, _next_expiry_in(now)
+            release_lease(store.state, run_id, now)
+            _released_at[run_id] = time.monotonic()
+
+        released_at = _released_at.pop(run_id, None)
+        if released_at is not None:
+            HANDOFFS.inc()
+            HANDOFF_SECONDS.observe(time.monotonic() - released_at)
         token = secrets.token_hex(16)
-        active = ActiveLease(
-            run_id=req.run_id,
+        store.state.leases[run_id] = ActiveLease(
+            run_id=run_id,
             lease_token=token,
             worker_id=req.worker_id,
-            expires_at=now_utc() + timedelta(seconds=LEASE_SECONDS),
+            expires_at=now + timedelta(seconds=LEASE_SECONDS),
+            granted_at=now,
         )
-        store.state.active_lease = active
-        store.state.run_status.setdefault(req.run_id, RunStatus(run_id=req.run_id))
-        store.save()
-        return AcquireLeaseResponse(
+        status = store.state.run_status.setdefault(run_id, RunStatus(run_id=run_id))
+        if status.status == "QUEUED":
+            status.status = "RUNNING"
+            status.updated_at = now
+        _persisted_expiry[run_id] = store.state.leases[run_id].expires_at
+        _last_seen[run_id] = time.monotonic()
+        _save([run_id, *changed])
+        granted = AcquireLeaseResponse(
             status="granted",
+            run_id=run_id,
             lease_token=token,
             lease_expires_in_sec=LEASE_SECONDS,
-            config=_default_config(req.run_id),
+            config=_default_config(run_id),
         )
+        return granted, None
 
 
 @app.post("/api/lease/renew")
 def renew_lease(req: RenewLeaseRequest) -> dict:
-    with store.with_lock():
-        lease = store.state.active_lease
-        if lease is None or _lease_expired(lease):
+    with _locked():
+        lease = _find_lease(req.run_id, req.lease_token)
+        if lease is None or lease.expires_at <= now_utc():
             raise HTTPException(status_code=409, detail="lease missing or expired")
         if lease.lease_token != req.lease_token or lease.worker_id != req.worker_id:
             raise HTTPException(status_code=403, detail="lease token mismatch")
 
-        lease.expires_at = now_utc() + timedelta(seconds=LEASE_SECONDS)
-        store.state.active_lease = lease
-        store.save()
+        _last_seen[lease.run_id] = time.monotonic()
+        if _extend_lease(lease, now_utc()):
+            _save([lease.run_id])
     return {"ok": True, "lease_expires_in_sec": LEASE_SECONDS}
 
 
+@app.post("/api/lease/heartbeat")
+def heartbeat(req: HeartbeatRequest) -> dict:
+    now = now_utc()
+    with _locked():
+        lease = store.state.leases.get(req.run_id)
+        if lease is None or lease.expires_at <= now:
+            raise HTTPException(status_code=409, detail="lease missing or expired")
+        if lease.lease_token != req.lease_token:
+            raise HTTPException(status_code=403, detail="lease token mismatch")
+
+        _last_seen[req.run_id] = time.monotonic()
+        dirty = _extend_lease(lease, now)
+        status = store.state.run_status.setdefault(req.run_id, RunStatus(run_id=req.run_id))
+        if req.step is not None:
+            status.last_reported_step = req.step
+            _note_step(req.run_id, req.step)
+        if req.latest_ckpt is not None and req.latest_ckpt != status.last_ckpt:
+            status.last_ckpt = req.latest_ckpt
+            dirty = True
+        if req.hf_revision is not None and req.hf_revision != status.last_hf_revision:
+            status.last_hf_revision = req.hf_revision
+            dirty = True
+        if status.status != "RUNNING":
+            status.status = "RUNNING"
+            dirty = True
+        if dirty:
+            status.updated_at = now
+            _save([req.run_id])
+    return {"ok": True, "ttl": LEASE_SECONDS}
+
+
 @app.post("/api/job/report")
 def report(req: JobReportRequest) -> dict:
-    with store.with_lock():
-        lease = store.state.active_lease
-        if lease is None or _lease_expired(lease):
+    with _locked():
+        lease = store.state.leases.get(req.run_id)
+        if lease is None or lease.expires_at <= now_utc():
             raise HTTPException(status_code=409, detail="lease missing or expired")
         if lease.lease_token != req.lease_token:
             raise HTTPException(status_code=403, detail="lease token mismatch")
 
         status = store.state.run_status.get(req.run_id, RunStatus(run_id=req.run_id))
         status.last_reported_step = req.step
+        _note_step(req.run_id, req.step)
         status.last_ckpt = req.latest_ckpt
         status.updated_at = now_utc()
         status.status = req.status
@@ -147,9 +381,20 @@ def report(req: JobReportRequest) -> dict:
             status.last_hf_repo = req.hf.repo
             status.last_hf_revision = req.hf.revision
         store.state.run_status[req.run_id] = status
-        if req.status in {"COMPLETED", "FAILED"} and lease.lease_token == req.lease_token:
-            store.state.active_lease = None
-        store.save()
+        released = req.status in RELEASING_STATUSES
+        if released:
+            release_lease(store.state, req.run_id, now_utc())
+            _persisted_expiry.pop(req.run_id, None)
+            _last_seen.pop(req.run_id, None)
+            if req.status not in TERMINAL_STATUSES:
+                _released_at[req.run_id] = time.monotonic()
+            else:
+                _forget_step(req.run_id)
+        else:
+            _last_seen[req.run_id] = time.monotonic()
+        _save([req.run_id])
+    if released:
+        notifier.notify()
     return {"ok": True}
 
 
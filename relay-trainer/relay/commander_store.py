@@ -0,0 +1,295 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from threading import Lock
+from typing import Iterable
+
+from relay.common.schema import ActiveLease, CommanderState, RunSpec, RunStatus
+
+SQLITE_SUFFIXES = {".db", ".sqlite", ".sqlite3"}
+
+
+class StateStore(ABC):
+    """In-memory `CommanderState` guarded by one lock and persisted by a backend.
+
+    `save(run_ids)` persists only the lease, status and spec of the listed runs when the backend
+    can write them individually; `save()` persists everything.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = Lock()
+        self.state = CommanderState()
+        self._load()
+
+    @abstractmethod
+    def _load(self) -> None:
+        """Populate `self.state` from the backend."""
+
+    @abstractmethod
+    def save(self, run_ids: Iterable[str] | None = None) -> None:
+        """Persist the listed runs, or the whole state when `run_ids` is None."""
+
+    def with_lock(self):
+        return self.lock
+
+    def wait_durable(self) -> None:
+        """Block until this thread's saves are on disk; call after releasing `lock`."""
+
+    def close(self) -> None:
+        pass
+
+    def _files(self) -> list[Path]:
+        return [self.path]
+
+    def size_bytes(self) -> int:
+        return sum(path.stat().st_size for path in self._files() if path.exists())
+
+    def export_json(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(self.state.model_dump_json(indent=2), encoding="utf-8")
+
+    def import_json(self, path: Path) -> None:
+        self.state = CommanderState.model_validate(json.loads(path.read_text(encoding="utf-8")))
+        self.save()
+
+
+class JsonStateStore(StateStore):
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        raw = json.loads(self.path.read_text(encoding="utf-8"))
+        self.state = CommanderState.model_validate(raw)
+
+    def save(self, run_ids: Iterable[str] | None = None) -> None:
+        del run_ids
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(self.state.model_dump_json(indent=2), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+class SqliteStateStore(StateStore):
+    """SQLite (WAL) backend with per-run rows, so a renew or report rewrites a single row."""
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Handlers run on the server threadpool; every access happens under `self.lock`.
+        conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS leases (run_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS specs (run_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        return conn
+
+    def _load(self) -> None:
+        self.conn = self._connect()
+        for (data,) in self.conn.execute("SELECT data FROM leases"):
+            lease = ActiveLease.model_validate_json(data)
+            self.state.leases[lease.run_id] = lease
+        for (data,) in self.conn.execute("SELECT data FROM runs"):
+            status = RunStatus.model_validate_json(data)
+            self.state.run_status[status.run_id] = status
+        for (data,) in self.conn.execute("SELECT data FROM specs"):
+            spec = RunSpec.model_validate_json(data)
+            self.state.runs[spec.run_id] = spec
+
+    def _write_run(self, run_id: str) -> None:
+        lease = self.state.leases.get(run_id)
+        if lease is None:
+            self.conn.execute("DELETE FROM leases WHERE run_id = ?", (run_id,))
+        else:
+            self.conn.execute("INSERT OR REPLACE INTO leases VALUES (?, ?)", (run_id, lease.model_dump_json()))
+        status = self.state.run_status.get(run_id)
+        if status is None:
+            self.conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+        else:
+            self.conn.execute("INSERT OR REPLACE INTO runs VALUES (?, ?)", (run_id, status.model_dump_json()))
+        spec = self.state.runs.get(run_id)
+        if spec is None:
+            self.conn.execute("DELETE FROM specs WHERE run_id = ?", (run_id,))
+        else:
+            self.conn.execute("INSERT OR REPLACE INTO specs VALUES (?, ?)", (run_id, spec.model_dump_json()))
+
+    def save(self, run_ids: Iterable[str] | None = None) -> None:
+        with self.conn:
+            self.conn.execute("BEGIN")
+            if run_ids is None:
+                for table in ("leases", "runs", "specs"):
+                    self.conn.execute(f"DELETE FROM {table}")
+                run_ids = set(self.state.leases) | set(self.state.run_status) | set(self.state.runs)
+            for run_id in run_ids:
+                self._write_run(run_id)
+
+    def _files(self) -> list[Path]:
+        return [self.path, self.path.with_name(self.path.name + "-wal")]
+
+
+def _fsync_write(path: Path, data: str) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class JournalStateStore(StateStore):
+    """JSON snapshot plus an append-only journal of per-run mutations (`<path>.journal`).
+
+    `save(run_ids)` appends one line per run holding its current lease, status and spec, so a
+    renew or report costs one small write instead of a full rewrite. A flusher thread fsyncs the
+    journal every `fsync_interval_sec` without holding `lock`, and `wait_durable` holds a writer
+    until the fsync covering its appends is done (group commit). `save()` and every
+    `compact_every` records write a fresh snapshot and truncate the journal. Recovery loads the
+    snapshot and replays the journal, dropping a torn last line.
+    """
+
+    def __init__(self, path: Path, fsync_interval_sec: float = 0.02, compact_every: int = 10000):
+        self.journal_path = path.with_name(path.name + ".journal")
+        self.fsync_interval_sec = fsync_interval_sec
+        self.compact_every = compact_every
+        self._records = 0
+        self._dirty = threading.Event()
+        self._closed = threading.Event()
+        # Serializes fsync against compaction/close without taking the request lock.
+        self._file_lock = Lock()
+        self._durable = threading.Condition()
+        # Appends written (under `lock`) vs. covered by a completed fsync.
+        self._written = 0
+        self._synced = 0
+        self._local = threading.local()
+        super().__init__(path)
+        self._flusher = threading.Thread(target=self._flush_loop, name="relay-journal-fsync", daemon=True)
+        self._flusher.start()
+
+    def _load(self) -> None:
+        if self.path.exists():
+            self.state = CommanderState.model_validate(json.loads(self.path.read_text(encoding="utf-8")))
+        good_bytes = 0
+        if self.journal_path.exists():
+            with self.journal_path.open("rb") as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except (ValueError, KeyError):
+                        # Torn tail from a crash mid-append; everything before it is intact.
+                        break
+                    good_bytes += len(line)
+                    self._records += 1
+        self.journal = self.journal_path.open("ab")
+        self.journal.truncate(good_bytes)
+
+    def _apply(self, record: dict) -> None:
+        run_id = record["run_id"]
+        for attr, model in (("leases", ActiveLease), ("run_status", RunStatus), ("runs", RunSpec)):
+            table = getattr(self.state, attr)
+            value = record.get(attr)
+            if value is None:
+                table.pop(run_id, None)
+            else:
+                table[run_id] = model.model_validate(value)
+
+    def _record(self, run_id: str) -> bytes:
+        record: dict = {"run_id": run_id}
+        for attr in ("leases", "run_status", "runs"):
+            value = getattr(self.state, attr).get(run_id)
+            record[attr] = value.model_dump(mode="json") if value is not None else None
+        return (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+
+    def save(self, run_ids: Iterable[str] | None = None) -> None:
+        if run_ids is None or self._records >= self.compact_every:
+            self.compact()
+            return
+        lines = [self._record(run_id) for run_id in run_ids]
+        if not lines:
+            return
+        self.journal.write(b"".join(lines))
+        self.journal.flush()
+        self._records += len(lines)
+        self._written += 1
+        self._local.generation = self._written
+        self._dirty.set()
+
+    def compact(self) -> None:
+        with self._file_lock:
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            _fsync_write(self.path, self.state.model_dump_json(indent=2))
+            # A crash before the truncate only replays idempotent upserts over the new snapshot.
+            self.journal.truncate(0)
+            os.fsync(self.journal.fileno())
+            self._records = 0
+        self._mark_synced(self._written)
+
+    def _files(self) -> list[Path]:
+        return [self.path, self.journal_path]
+
+    def _mark_synced(self, generation: int) -> None:
+        with self._durable:
+            self._synced = max(self._synced, generation)
+            self._durable.notify_all()
+
+    def sync(self) -> None:
+        self._dirty.clear()
+        # Appends counted in `_written` were flushed to the file before the counter moved.
+        generation = self._written
+        with self._file_lock:
+            if self.journal.closed:
+                return
+            os.fsync(self.journal.fileno())
+        self._mark_synced(generation)
+
+    def wait_durable(self) -> None:
+        generation = getattr(self._local, "generation", 0)
+        if not generation:
+            return
+        self._local.generation = 0
+        with self._durable:
+            self._durable.wait_for(lambda: self._synced >= generation or self._closed.is_set())
+
+    def _flush_loop(self) -> None:
+        while not self._closed.is_set():
+            self._dirty.wait()
+            if self._closed.wait(self.fsync_interval_sec):
+                return
+            self.sync()
+
+    def close(self) -> None:
+        self._closed.set()
+        self._dirty.set()
+        self._flusher.join()
+        with self.lock, self._file_lock:
+            if self.journal.closed:
+                return
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            self.journal.close()
+        self._mark_synced(self._written)
+
+
+def open_state_store(path: Path, backend: str | None = None) -> StateStore:
+    """Open the commander state store; `backend` defaults to the path suffix (`.db` => sqlite)."""
+    backend = (backend or ("sqlite" if path.suffix in SQLITE_SUFFIXES else "json")).lower()
+    if backend == "sqlite":
+        return SqliteStateStore(path)
+    if backend == "journal":
+        return JournalStateStore(
+            path,
+            fsync_interval_sec=float(os.getenv("RELAY_JOURNAL_FSYNC_MS", "20")) / 1000,
+            compact_every=int(os.getenv("RELAY_JOURNAL_COMPACT_EVERY", "10000")),
+        )
+    if backend == "json":
+        return JsonStateStore(path)
+    raise ValueError(f"unknown commander state backend: {backend}")
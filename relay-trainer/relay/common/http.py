@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+import asyncio
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Any
 
 import requests
+from requests.adapters import HTTPAdapter
 
 
 @dataclass
@@ -12,13 +15,24 @@ class HttpClient:
     timeout: int = 15
     retries: int = 5
     backoff_sec: float = 1.0
+    pool_size: int = 4
+    session: requests.Session = field(init=False, repr=False)
 
-    def post(self, path: str, payload: dict, headers: dict | None = None) -> requests.Response:
+    def __post_init__(self) -> None:
+        # One keep-alive pool per client, so renew/report reuse the TCP+TLS connection.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(
+        self, path: str, payload: dict, headers: dict | None = None, timeout: float | None = None
+    ) -> requests.Response:
         url = self.base_url.rstrip("/") + path
         error: Exception | None = None
         for i in range(self.retries):
             try:
-                resp = requests.post(url, json=payload, headers=headers or {}, timeout=self.timeout)
+                resp = self.session.post(url, json=payload, headers=headers or {}, timeout=timeout or self.timeout)
                 if resp.status_code < 500:
                     return resp
                 error = RuntimeError(f"server error {resp.status_code}: {resp.text}")
@@ -29,3 +43,57 @@ class HttpClient:
         if error is None:
             raise RuntimeError(f"request failed: {url}")
         raise RuntimeError(f"request failed: {url}: {error}")
+
+    def close(self) -> None:
+        self.session.close()
+
+
+@dataclass
+class AsyncHttpClient:
+    """httpx-based async sibling of HttpClient with the same retry/backoff semantics.
+
+    Requires the optional `httpx` dependency (`pip install 'relay-trainer[async]'`).
+    """
+
+    base_url: str
+    timeout: int = 15
+    retries: int = 5
+    backoff_sec: float = 1.0
+    pool_size: int = 4
+    client: Any = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        import httpx
+
+        self._httpx = httpx
+        self.client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+        )
+
+    async def post(self, path: str, payload: dict, headers: dict | None = None, timeout: float | None = None):
+        url = self.base_url.rstrip("/") + path
+        error: Exception | None = None
+        for i in range(self.retries):
+            try:
+                kwargs = {"timeout": timeout} if timeout else {}
+                resp = await self.client.post(url, json=payload, headers=headers or {}, **kwargs)
+                if resp.status_code < 500:
+                    return resp
+                error = RuntimeError(f"server error {resp.status_code}: {resp.text}")
+            except self._httpx.HTTPError as exc:
+                error = exc
+            if i < self.retries - 1:
+                await asyncio.sleep(self.backoff_sec * (2**i))
+        if error is None:
+            raise RuntimeError(f"request failed: {url}")
+        raise RuntimeError(f"request failed: {url}: {error}")
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def __aenter__(self) -> "AsyncHttpClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
@@ -3,7 +3,11 @@ from __future__ import annotations
 from datetime import datetime, timezone
 from typing import Literal
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
 
 
 class Capability(BaseModel):
@@ -13,14 +17,18 @@ class Capability(BaseModel):
 
 class AcquireLeaseRequest(BaseModel):
     worker_id: str
-    run_id: str
+    # Omit to let the commander schedule a queued run that fits `cap`.
+    run_id: str | None = None
     cap: Capability | None = None
     force: bool = False
+    # Long-poll: hold the request up to this long (capped server-side) until a lease frees up.
+    wait_sec: float = Field(default=0.0, ge=0)
 
 
 class WorkerConfig(BaseModel):
     l1_root: str = "/mnt/relay"
     run_id: str
+    mode: Literal["sft", "rl"] | None = None
     ckpt_interval_sec: int = 600
     ckpt_keep_last_n: int = 3
     hf_sync_interval_sec: int = 4 * 3600
@@ -30,6 +38,7 @@ class WorkerConfig(BaseModel):
 
 class AcquireLeaseResponse(BaseModel):
     status: Literal["granted", "denied"]
+    run_id: str | None = None
     lease_token: str | None = None
     lease_expires_in_sec: int | None = None
     reason: str | None = None
@@ -39,6 +48,17 @@ class AcquireLeaseResponse(BaseModel):
 class RenewLeaseRequest(BaseModel):
     lease_token: str
     worker_id: str
+    run_id: str | None = None
+
+
+class HeartbeatRequest(BaseModel):
+    """Renew plus progress in one message; the commander persists it only when something changed."""
+
+    run_id: str
+    lease_token: str
+    step: int | None = None
+    latest_ckpt: str | None = None
+    hf_revision: str | None = None
 
 
 class JobHFStatus(BaseModel):
@@ -62,6 +82,19 @@ class ActiveLease(BaseModel):
     lease_token: str
     worker_id: str
     expires_at: datetime
+    granted_at: datetime = Field(default_factory=_utc_now)
+
+
+class RunSpec(BaseModel):
+    run_id: str
+    mode: Literal["sft", "rl"] | None = None
+    priority: int = 0
+    # Fair-share weight: among equal priorities the run with the least lease time per weight goes first.
+    weight: float = Field(default=1.0, gt=0)
+    gpu: str | None = None
+    gpu_count: int | None = None
+    hf_repo: str | None = None
+    submitted_at: datetime = Field(default_factory=_utc_now)
 
 
 class RunStatus(BaseModel):
@@ -70,11 +103,24 @@ class RunStatus(BaseModel):
     last_ckpt: str | None = None
     last_hf_repo: str | None = None
     last_hf_revision: str | None = None
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    status: Literal["RUNNING", "PREEMPTED", "FAILED", "COMPLETED"] = "RUNNING"
+    updated_at: datetime = Field(default_factory=_utc_now)
+    status: Literal["QUEUED", "RUNNING", "PREEMPTED", "FAILED", "COMPLETED"] = "RUNNING"
     msg: str | None = None
+    usage_sec: float = 0.0
 
 
 class CommanderState(BaseModel):
-    active_lease: ActiveLease | None = None
+    leases: dict[str, ActiveLease] = Field(default_factory=dict)
+    runs: dict[str, RunSpec] = Field(default_factory=dict)
     run_status: dict[str, RunStatus] = Field(default_factory=dict)
+
+    @model_validator(mode="before")
+    @classmethod
+    def _migrate_single_lease(cls, data):
+        # State files written before per-run leases hold one `active_lease`.
+        if isinstance(data, dict) and "active_lease" in data:
+            data = dict(data)
+            lease = data.pop("active_lease")
+            if lease:
+                data.setdefault("leases", {})[lease["run_id"]] = lease
+        return data
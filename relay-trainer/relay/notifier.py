@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+
+
+def _resolve(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+class LeaseNotifier:
+    """Wakes long-polling acquirers when a lease is released or expires, or a run is queued.
+
+    `notify()` may be called from any thread (sync handlers run on the server threadpool).
+    Waiters pass the `seq` they read before checking state, so a release that lands between
+    the check and `wait()` is never missed.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._waiters: set[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = set()
+        self.seq = 0
+
+    def notify(self) -> None:
+        with self._lock:
+            self.seq += 1
+            waiters, self._waiters = self._waiters, set()
+        for loop, fut in waiters:
+            loop.call_soon_threadsafe(_resolve, fut)
+
+    async def wait(self, since: int, timeout: float) -> bool:
+        loop = asyncio.get_running_loop()
+        entry = (loop, loop.create_future())
+        with self._lock:
+            if self.seq != since:
+                return True
+            self._waiters.add(entry)
+        try:
+            await asyncio.wait_for(entry[1], timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                self._waiters.discard(entry)
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from relay.common.schema import Capability, CommanderState, RunSpec, RunStatus
+
+TERMINAL_STATUSES = {"COMPLETED", "FAILED"}
+# Reported statuses after which the worker is gone and its lease can be handed over.
+RELEASING_STATUSES = TERMINAL_STATUSES | {"PREEMPTED"}
+
+
+def lease_live(state: CommanderState, run_id: str, now: datetime) -> bool:
+    lease = state.leases.get(run_id)
+    return lease is not None and lease.expires_at > now
+
+
+def release_lease(state: CommanderState, run_id: str, now: datetime) -> bool:
+    """Drop the lease on `run_id` and charge its held time to the run's fair-share usage."""
+    lease = state.leases.pop(run_id, None)
+    if lease is None:
+        return False
+    held = (min(now, lease.expires_at) - lease.granted_at).total_seconds()
+    status = state.run_status.setdefault(run_id, RunStatus(run_id=run_id))
+    status.usage_sec += max(0.0, held)
+    return True
+
+
+def release_expired(state: CommanderState, now: datetime) -> list[str]:
+    expired = [run_id for run_id, lease in state.leases.items() if lease.expires_at <= now]
+    for run_id in expired:
+        release_lease(state, run_id, now)
+    return expired
+
+
+def cap_matches(spec: RunSpec, cap: Capability | None) -> bool:
+    if spec.gpu is not None:
+        if cap is None or cap.gpu is None or cap.gpu.lower() != spec.gpu.lower():
+            return False
+    if spec.gpu_count:
+        if cap is None or (cap.count or 0) < spec.gpu_count:
+            return False
+    return True
+
+
+def pick_run(state: CommanderState, cap: Capability | None, now: datetime) -> str | None:
+    """Choose the queued run a worker with `cap` should take next.
+
+    Highest priority first; within a priority the run with the least lease time per unit of
+    weight (fair share), then the oldest submission.
+    """
+    best: tuple | None = None
+    best_run: str | None = None
+    for run_id, spec in state.runs.items():
+        if lease_live(state, run_id, now) or not cap_matches(spec, cap):
+            continue
+        status = state.run_status.get(run_id)
+        if status is not None and status.status in TERMINAL_STATUSES:
+            continue
+        usage = status.usage_sec if status is not None else 0.0
+        key = (-spec.priority, usage / spec.weight, spec.submitted_at)
+        if best is None or key < best:
+            best, best_run = key, run_id
+    return best_run
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import os
+import stat
+from pathlib import Path
+
+
+class ObjectStore:
+    """Content-addressed blob store under `<run_root>/objects`.
+
+    Step dirs reference blobs by the sha256 already recorded in their manifest: every file is a
+    hardlink to `objects/<sha[:2]>/<sha[2:]>`, so byte-identical files across `step_*` dirs share
+    one inode. A blob's link count is its refcount; `gc` drops blobs only the store still links.
+    Blobs are made read-only because an in-place write would change every step sharing them.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:]
+
+    def ingest(self, step_dir: Path, manifest: dict) -> int:
+        """Link `step_dir` files into the store, updating manifest stat fields; returns bytes saved."""
+        saved = 0
+        for item in manifest.get("files", []):
+            digest = item.get("sha256")
+            if not digest:
+                continue
+            src = step_dir / item["path"]
+            try:
+                if self._replace_with_blob(src, digest, item["size"]):
+                    saved += item["size"]
+            except OSError:
+                # Cross-device, unsupported or racing writers: keep the private copy.
+                continue
+            st = src.stat()
+            item["mtime_ns"] = st.st_mtime_ns
+            item["inode"] = st.st_ino
+        return saved
+
+    def _replace_with_blob(self, src: Path, digest: str, size: int) -> bool:
+        blob = self.path_for(digest)
+        src_ino = src.stat().st_ino
+        try:
+            blob_st = blob.stat()
+        except FileNotFoundError:
+            blob_st = None
+        if blob_st is not None:
+            if blob_st.st_ino == src_ino:
+                return False
+            if blob_st.st_size != size:
+                raise OSError(f"object size mismatch: {blob}")
+            tmp = src.with_name(src.name + ".cas-tmp")
+            try:
+                os.link(blob, tmp)
+            except FileNotFoundError:
+                pass  # collected between stat and link; re-add from the private copy
+            else:
+                os.replace(tmp, src)
+                return True
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        os.link(src, blob)
+        os.chmod(blob, stat.S_IMODE(blob.stat().st_mode) & ~0o222)
+        return False
+
+    def gc(self) -> int:
+        """Remove blobs no step dir links anymore; returns the number of blobs removed."""
+        removed = 0
+        for fanout in self.root.iterdir():
+            if not fanout.is_dir():
+                continue
+            for blob in fanout.iterdir():
+                try:
+                    if blob.stat().st_nlink <= 1:
+                        blob.unlink()
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+        return removed
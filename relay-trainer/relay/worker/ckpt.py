@@ -1,10 +1,29 @@
 from __future__ import annotations
 
 import json
+import mmap
 import os
 import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 from hashlib import sha256
 from pathlib import Path
+from typing import TYPE_CHECKING
+from uuid import uuid4
+
+from relay.worker.telemetry import Telemetry, maybe_span
+
+if TYPE_CHECKING:
+    from relay.worker.cas import ObjectStore
+    from relay.worker.reclaim import TrashReclaimer
+
+HASH_CHUNK_BYTES = 16 * 1024 * 1024
+HASH_WORKERS = int(os.getenv("RELAY_MANIFEST_WORKERS", "0")) or min(8, os.cpu_count() or 1)
+MANIFEST_NAME = "manifest.json"
+VERIFIED_NAME = ".verified"
+VERIFY_MODES = ("stat", "full")
+TRASH_DIR = "_trash"
+EVENTS_NAME = "events.log"
 
 
 def ensure_run_dirs(run_root: Path) -> dict[str, Path]:
@@ -12,6 +31,7 @@ def ensure_run_dirs(run_root: Path) -> dict[str, Path]:
         "run_root": run_root,
         "ckpt_root": run_root / "ckpt",
         "staging_root": run_root / "ckpt" / "_staging",
+        "trash_root": run_root / "ckpt" / TRASH_DIR,
         "hf_root": run_root / "hf",
         "logs_root": run_root / "logs",
     }
@@ -23,41 +43,154 @@ def ensure_run_dirs(run_root: Path) -> dict[str, Path]:
 def _file_sha256(path: Path) -> str:
     h = sha256()
     with path.open("rb") as f:
-        while True:
-            chunk = f.read(1024 * 1024)
-            if not chunk:
-                break
-            h.update(chunk)
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return h.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            for offset in range(0, size, HASH_CHUNK_BYTES):
+                h.update(view[offset : offset + HASH_CHUNK_BYTES])
     return h.hexdigest()
 
 
-def build_manifest(step_dir: Path) -> dict:
+def _stat_key(size: int, mtime_ns: int, inode: int) -> tuple[int, int, int]:
+    return (size, mtime_ns, inode)
+
+
+def _known_digests(previous: dict | None) -> dict[tuple[int, int, int], str]:
+    # Files that are hardlinked or untouched since the previous step keep (size, mtime, inode),
+    # so their digest can be reused without reading a byte.
+    known: dict[tuple[int, int, int], str] = {}
+    for item in (previous or {}).get("files", []):
+        if item.get("sha256") and "mtime_ns" in item and "inode" in item:
+            known[_stat_key(item["size"], item["mtime_ns"], item["inode"])] = item["sha256"]
+    return known
+
+
+def load_manifest(step_dir: Path) -> dict | None:
+    manifest_file = step_dir / MANIFEST_NAME
+    if not manifest_file.exists():
+        return None
+    try:
+        return json.loads(manifest_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def build_manifest(
+    step_dir: Path, previous: dict | None = None, workers: int | None = None, hash_files: bool = True
+) -> dict:
+    """List `step_dir` with sizes, stats and sha256 digests.
+
+    With `hash_files=False` (emergency saves) only digests reusable from `previous` are filled
+    in; the rest stay None and are checked by size alone until a later full manifest.
+    """
+    known = _known_digests(previous)
     files = []
+    pending = []
     for path in sorted(step_dir.rglob("*")):
-        if path.is_file():
-            rel = path.relative_to(step_dir).as_posix()
-            files.append({"path": rel, "size": path.stat().st_size, "sha256": _file_sha256(path)})
+        if not path.is_file():
+            continue
+        rel = path.relative_to(step_dir).as_posix()
+        if rel in (MANIFEST_NAME, VERIFIED_NAME):
+            continue
+        st = path.stat()
+        item = {
+            "path": rel,
+            "size": st.st_size,
+            "sha256": known.get(_stat_key(st.st_size, st.st_mtime_ns, st.st_ino)),
+            "mtime_ns": st.st_mtime_ns,
+            "inode": st.st_ino,
+        }
+        if item["sha256"] is None:
+            pending.append(item)
+        files.append(item)
+    if pending and hash_files:
+        with ThreadPoolExecutor(max_workers=workers or HASH_WORKERS) as pool:
+            digests = pool.map(_file_sha256, [step_dir / item["path"] for item in pending])
+            for item, digest in zip(pending, digests):
+                item["sha256"] = digest
     return {"file_count": len(files), "files": files}
 
 
-def save_manifest(step_dir: Path) -> None:
-    manifest = build_manifest(step_dir)
-    (step_dir / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+def write_manifest(step_dir: Path, manifest: dict) -> None:
+    (step_dir / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
 
 
-def verify_step_dir(step_dir: Path) -> bool:
-    manifest_file = step_dir / "manifest.json"
-    if not manifest_file.exists():
+def save_manifest(step_dir: Path, previous: dict | None = None) -> dict:
+    manifest = build_manifest(step_dir, previous=previous)
+    write_manifest(step_dir, manifest)
+    return manifest
+
+
+def _stat_signatures(step_dir: Path, manifest: dict) -> dict[str, list[int]] | None:
+    sigs = {}
+    for item in manifest.get("files", []):
+        try:
+            st = (step_dir / item["path"]).stat()
+        except OSError:
+            return None
+        sigs[item["path"]] = [st.st_size, st.st_mtime_ns, st.st_ino]
+    return sigs
+
+
+def _manifest_digest(step_dir: Path) -> str | None:
+    try:
+        return sha256((step_dir / MANIFEST_NAME).read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def write_verified(step_dir: Path, manifest: dict | None = None) -> None:
+    """Record that `step_dir` matched its manifest, keyed by manifest digest and per-file stat."""
+    manifest = manifest if manifest is not None else load_manifest(step_dir)
+    digest = _manifest_digest(step_dir)
+    sigs = _stat_signatures(step_dir, manifest) if manifest is not None else None
+    if digest is None or sigs is None:
+        return
+    record = {"manifest_sha256": digest, "files": sigs}
+    tmp = step_dir / (VERIFIED_NAME + ".tmp")
+    tmp.write_text(json.dumps(record), encoding="utf-8")
+    os.replace(tmp, step_dir / VERIFIED_NAME)
+
+
+def _verified_cache_hit(step_dir: Path, manifest: dict) -> bool:
+    try:
+        record = json.loads((step_dir / VERIFIED_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
         return False
-    data = json.loads(manifest_file.read_text(encoding="utf-8"))
-    for item in data.get("files", []):
+    if record.get("manifest_sha256") != _manifest_digest(step_dir):
+        return False
+    return record.get("files") == _stat_signatures(step_dir, manifest)
+
+
+def verify_step_dir(step_dir: Path, mode: str = "full") -> bool:
+    """Check `step_dir` against its manifest.
+
+    `stat` accepts the dir when its `.verified` record still matches the manifest digest and
+    every file's (size, mtime, inode); otherwise it falls back to `full`, which re-hashes every
+    file and refreshes the record on success. Files recorded without a digest (stat-only
+    emergency manifests) are checked by size only.
+    """
+    if mode not in VERIFY_MODES:
+        raise ValueError(f"unknown verify mode: {mode}")
+    data = load_manifest(step_dir)
+    if data is None:
+        return False
+    if mode == "stat" and _verified_cache_hit(step_dir, data):
+        return True
+    items = data.get("files", [])
+    for item in items:
         file_path = step_dir / item["path"]
         if not file_path.exists() or not file_path.is_file():
             return False
         if file_path.stat().st_size != item["size"]:
             return False
-        if _file_sha256(file_path) != item["sha256"]:
+    hashed = [item for item in items if item["sha256"] is not None]
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+        digests = pool.map(_file_sha256, [step_dir / item["path"] for item in hashed])
+        if any(digest != item["sha256"] for item, digest in zip(hashed, digests)):
             return False
+    write_verified(step_dir, data)
     return True
 
 
@@ -68,9 +201,9 @@ def list_step_dirs(ckpt_root: Path) -> list[Path]:
     )
 
 
-def latest_valid_step(ckpt_root: Path) -> Path | None:
+def latest_valid_step(ckpt_root: Path, mode: str = "stat") -> Path | None:
     for step_dir in reversed(list_step_dirs(ckpt_root)):
-        if verify_step_dir(step_dir):
+        if verify_step_dir(step_dir, mode=mode):
             return step_dir
     return None
 
@@ -85,29 +218,83 @@ def update_latest_symlink(ckpt_root: Path, step_dir: Path) -> None:
     os.replace(tmp, latest)
 
 
-def prune_old_ckpt(ckpt_root: Path, keep_last_n: int) -> None:
+def move_to_trash(ckpt_root: Path, path: Path) -> Path:
+    """Atomically rename `path` into `ckpt/_trash` so it can be deleted off the critical path."""
+    trash_root = ckpt_root / TRASH_DIR
+    trash_root.mkdir(parents=True, exist_ok=True)
+    dst = trash_root / f"{path.name}.{uuid4().hex[:8]}"
+    os.replace(path, dst)
+    return dst
+
+
+def _discard(
+    ckpt_root: Path,
+    paths: list[Path],
+    reclaimer: "TrashReclaimer | None",
+    object_store: "ObjectStore | None" = None,
+) -> list[Path]:
+    trashed = [move_to_trash(ckpt_root, path) for path in paths if path.exists()]
+    if reclaimer is not None:
+        # The reclaimer is expected to run object_store.gc once the trash is empty.
+        reclaimer.wake()
+    else:
+        for path in trashed:
+            shutil.rmtree(path, ignore_errors=True)
+        if trashed and object_store is not None:
+            object_store.gc()
+    return trashed
+
+
+def prune_old_ckpt(
+    ckpt_root: Path,
+    keep_last_n: int,
+    reclaimer: "TrashReclaimer | None" = None,
+    object_store: "ObjectStore | None" = None,
+) -> list[Path]:
     steps = list_step_dirs(ckpt_root)
-    for old in steps[:-keep_last_n]:
-        shutil.rmtree(old, ignore_errors=True)
+    return _discard(ckpt_root, steps[:-keep_last_n], reclaimer, object_store)
 
 
-def finalize_external_checkpoint(staging_root: Path, ckpt_root: Path, step_name: str, keep_last_n: int) -> Path:
+def finalize_external_checkpoint(
+    staging_root: Path,
+    ckpt_root: Path,
+    step_name: str,
+    keep_last_n: int,
+    reclaimer: "TrashReclaimer | None" = None,
+    object_store: "ObjectStore | None" = None,
+    telemetry: "Telemetry | None" = None,
+    manifest: dict | None = None,
+    hash_files: bool = True,
+) -> Path:
     src = staging_root / step_name
     if not src.exists():
         raise FileNotFoundError(f"staging checkpoint missing: {src}")
-    save_manifest(src)
+    if manifest is None:
+        previous_steps = list_step_dirs(ckpt_root)
+        previous = load_manifest(previous_steps[-1]) if previous_steps else None
+        with maybe_span(telemetry, "ckpt_manifest", checkpoint=step_name, hashed=hash_files) as span:
+            manifest = build_manifest(src, previous=previous, hash_files=hash_files)
+            span["files"] = len(manifest["files"])
+            span["bytes"] = sum(entry["size"] for entry in manifest["files"])
+    if object_store is not None:
+        with maybe_span(telemetry, "ckpt_dedup", checkpoint=step_name):
+            object_store.ingest(src, manifest)
+    write_manifest(src, manifest)
     dst = ckpt_root / step_name
     if dst.exists():
         # Allow idempotent step names from external trainers on resume.
-        if verify_step_dir(dst):
-            shutil.rmtree(src, ignore_errors=True)
+        if verify_step_dir(dst, mode="stat"):
+            _discard(ckpt_root, [src], reclaimer, object_store)
             update_latest_symlink(ckpt_root, dst)
-            prune_old_ckpt(ckpt_root, keep_last_n)
+            with maybe_span(telemetry, "ckpt_prune", checkpoint=step_name):
+                prune_old_ckpt(ckpt_root, keep_last_n, reclaimer, object_store)
             return dst
-        shutil.rmtree(dst, ignore_errors=True)
+        _discard(ckpt_root, [dst], reclaimer, object_store)
     os.replace(src, dst)
+    write_verified(dst, manifest)
     update_latest_symlink(ckpt_root, dst)
-    prune_old_ckpt(ckpt_root, keep_last_n)
+    with maybe_span(telemetry, "ckpt_prune", checkpoint=step_name):
+        prune_old_ckpt(ckpt_root, keep_last_n, reclaimer, object_store)
     return dst
 
 
@@ -118,8 +305,22 @@ def write_state(run_root: Path, payload: dict) -> None:
     os.replace(tmp, path)
 
 
+def open_event_log(run_root: Path) -> Telemetry:
+    """Batched writer for `<run_root>/events.log`; never rotated, since the log is synced to HF whole."""
+    return Telemetry(run_root / EVENTS_NAME, max_bytes=0)
+
+
 def append_event(run_root: Path, event: str, **kwargs) -> None:
-    log_path = run_root / "events.log"
-    msg = {"event": event, **kwargs}
+    """Append one record straight to `events.log`, for callers without an `open_event_log` writer."""
+    log_path = run_root / EVENTS_NAME
+    msg = {"ts": time.time(), "mono": time.monotonic(), "event": event, **kwargs}
     with log_path.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(msg, ensure_ascii=True) + "\n")
+        f.write(json.dumps(msg, ensure_ascii=True, default=str) + "\n")
+
+
+def log_event(events: Telemetry | None, run_root: Path, event: str, **kwargs) -> None:
+    """`events.event(...)` when the worker passed its batched writer, else `append_event`."""
+    if events is not None:
+        events.event(event, **kwargs)
+    else:
+        append_event(run_root, event, **kwargs)
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable
+
+
+class CheckpointFinalizer:
+    """Single background executor for checkpoint finalize / prune / HF snapshot jobs.
+
+    The worker control loop only submits jobs and polls for finished ones, so lease renew and
+    report keep their cadence however long a job takes. At most `max_pending` jobs are queued;
+    while the queue is full `backpressure_file` exists so the trainer can hold off new saves.
+    Not thread-safe: submit/poll/drain are meant to be called from the control loop only.
+    """
+
+    def __init__(self, max_pending: int = 2, backpressure_file: Path | None = None):
+        self.max_pending = max(1, max_pending)
+        self.backpressure_file = backpressure_file
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="relay-finalizer")
+        self._pending: dict[str, Future] = {}
+        self._set_backpressure(False)
+
+    def _set_backpressure(self, on: bool) -> None:
+        if self.backpressure_file is None:
+            return
+        if on:
+            self.backpressure_file.touch()
+        else:
+            self.backpressure_file.unlink(missing_ok=True)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def submit(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> bool:
+        """Queue `fn` under `key`; returns False (and raises back-pressure) when the queue is full."""
+        if key in self._pending:
+            return True
+        if len(self._pending) >= self.max_pending:
+            self._set_backpressure(True)
+            return False
+        self._pending[key] = self._executor.submit(fn, *args, **kwargs)
+        if len(self._pending) >= self.max_pending:
+            self._set_backpressure(True)
+        return True
+
+    def poll(self) -> list[tuple[str, Future]]:
+        done = [(key, fut) for key, fut in self._pending.items() if fut.done()]
+        for key, _ in done:
+            del self._pending[key]
+        if len(self._pending) < self.max_pending:
+            self._set_backpressure(False)
+        return done
+
+    def drain(self, timeout: float | None = None) -> list[tuple[str, Future]]:
+        """Wait up to `timeout` seconds for every queued job and return the finished ones."""
+        if self._pending:
+            wait(list(self._pending.values()), timeout=timeout)
+        return self.poll()
+
+    def wait_any(self, timeout: float) -> list[tuple[str, Future]]:
+        if self._pending:
+            wait(list(self._pending.values()), timeout=timeout, return_when=FIRST_COMPLETED)
+        return self.poll()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._set_backpressure(False)
@@ -4,62 +4,425 @@ import json
 import os
 import shutil
 import tempfile
+import threading
+from contextlib import suppress
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable
 
-from huggingface_hub import HfApi
+from huggingface_hub import CommitOperationAdd, CommitOperationDelete, HfApi
+
+from relay.worker.ckpt import MANIFEST_NAME, VERIFIED_NAME, load_manifest, log_event
+from relay.worker.telemetry import maybe_span
+
+if TYPE_CHECKING:
+    from relay.worker.telemetry import Telemetry
 
 
 def _utc_now() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-def make_snapshot(latest_ckpt: Path, run_root: Path) -> Path:
+_FICLONE = 0x40049409
+
+
+def _reflink(src: Path, dst: Path) -> None:
+    import fcntl
+
+    with src.open("rb") as fsrc, dst.open("wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    try:
+        _reflink(src, dst)
+        return
+    except (OSError, ImportError):
+        dst.unlink(missing_ok=True)
+    shutil.copy2(src, dst)
+
+
+@dataclass
+class Snapshot:
+    """Upload view of one checkpoint: repo paths mapped to local files or in-memory bytes.
+
+    Checkpoint files are pinned by hardlinks (or reflinks) under `root`, so pruning the step
+    mid-upload cannot pull them away and no checkpoint bytes are duplicated. The small, still
+    growing run files (`state.json`, `events.log`) are captured in memory at snapshot time.
+    """
+
+    root: Path
+    files: dict[str, Path] = field(default_factory=dict)
+    blobs: dict[str, bytes] = field(default_factory=dict)
+    manifest: dict | None = None
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+SNAPSHOT_PREFIX = "relay_hf_snapshot_"
+DRY_RUN_PREFIX = "dry-run-"
+
+
+def sweep_stale_snapshots(run_root: Path) -> int:
+    """Remove snapshot dirs a crashed or killed upload left under `<run_root>/hf`.
+
+    They pin pruned checkpoints' bytes (and object store blobs) on L1. Only call this while
+    holding the run's lease, when no other upload of the run can be in flight.
+    """
+    hf_root = run_root / "hf"
+    if not hf_root.is_dir():
+        return 0
+    stale = [path for path in hf_root.glob(f"{SNAPSHOT_PREFIX}*") if path.is_dir()]
+    for path in stale:
+        shutil.rmtree(path, ignore_errors=True)
+    return len(stale)
+
+
+def make_snapshot(latest_ckpt: Path, run_root: Path) -> Snapshot:
     if not latest_ckpt.exists():
         raise FileNotFoundError(f"latest checkpoint missing: {latest_ckpt}")
-    tmp_dir = Path(tempfile.mkdtemp(prefix="relay_hf_snapshot_"))
-    snapshot = tmp_dir / "snapshot"
-    shutil.copytree(latest_ckpt, snapshot / "ckpt")
-
-    state = run_root / "state.json"
-    if state.exists():
-        (snapshot / "state.json").write_text(state.read_text(encoding="utf-8"), encoding="utf-8")
-    events = run_root / "events.log"
-    if events.exists():
-        (snapshot / "events.log").write_text(events.read_text(encoding="utf-8"), encoding="utf-8")
+    # Pin next to the checkpoint so files can be hardlinked instead of copied.
+    hf_root = run_root / "hf"
+    hf_root.mkdir(parents=True, exist_ok=True)
+    snapshot = Snapshot(root=Path(tempfile.mkdtemp(prefix=SNAPSHOT_PREFIX, dir=hf_root)))
+    try:
+        for path in sorted(latest_ckpt.rglob("*")):
+            if not path.is_file():
+                continue
+            rel = path.relative_to(latest_ckpt).as_posix()
+            if rel == VERIFIED_NAME:
+                continue
+            pinned = snapshot.root / rel
+            pinned.parent.mkdir(parents=True, exist_ok=True)
+            _link_or_copy(path, pinned)
+            snapshot.files[f"ckpt/{rel}"] = pinned
+        snapshot.manifest = load_manifest(snapshot.root)
+        for name in ("state.json", "events.log"):
+            run_file = run_root / name
+            if run_file.exists():
+                snapshot.blobs[name] = run_file.read_bytes()
+    except BaseException:
+        snapshot.cleanup()
+        raise
     return snapshot
 
 
+def _load_last_synced(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _chunked(upload: dict[str, Path], chunk_bytes: int | None) -> list[dict[str, Path]]:
+    chunks: list[dict[str, Path]] = [{}]
+    size = 0
+    for repo_path, local in upload.items():
+        nbytes = local.stat().st_size
+        if chunk_bytes and chunks[-1] and size + nbytes > chunk_bytes:
+            chunks.append({})
+            size = 0
+        chunks[-1][repo_path] = local
+        size += nbytes
+    return chunks
+
+
+def _write_last_synced(path: Path, payload: dict) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
 def sync_snapshot(
-    snapshot_dir: Path,
+    snapshot: Snapshot,
     run_root: Path,
     repo_id: str,
     revision_branch: str = "main",
     dry_run: bool = False,
+    delta: bool = False,
+    chunk_bytes: int | None = None,
+    progress: Callable[[dict], None] | None = None,
 ) -> str:
+    """Commit `snapshot` to `repo_id` straight from its file list.
+
+    With `delta`, only checkpoint files whose sha256 differs from the manifest recorded in
+    `hf/last_synced.json` for the same repo and branch are uploaded, and files that disappeared
+    from the checkpoint are deleted remotely. With `chunk_bytes`, files are committed in chunks
+    of about that size and the record is updated after each one, so a delta sync interrupted
+    midway resumes with the files that are still missing. The manifest, run files and deletions
+    go into the last commit. A dry run records its revision but no files, so the next real
+    delta sync still uploads everything.
+    """
     last_synced = run_root / "hf" / "last_synced.json"
     last_synced.parent.mkdir(parents=True, exist_ok=True)
 
-    if dry_run:
-        revision = f"dry-run-{int(datetime.now(timezone.utc).timestamp())}"
-    else:
+    manifest = snapshot.manifest
+    files = {item["path"]: item["sha256"] for item in manifest["files"]} if manifest else None
+    previous = _load_last_synced(last_synced)
+    upload = dict(snapshot.files)
+    removed: list[str] = []
+    synced_files: dict[str, str] = {}
+    if (
+        delta
+        and files is not None
+        and previous.get("files") is not None
+        and not str(previous.get("revision", "")).startswith(DRY_RUN_PREFIX)
+        and previous.get("repo") == repo_id
+        and previous.get("branch", "main") == revision_branch
+    ):
+        synced_files = dict(previous["files"])
+        # Files from a stat-only (emergency) manifest have no digest and are always re-sent.
+        changed = {path for path, digest in files.items() if digest is None or synced_files.get(path) != digest}
+        upload = {p: local for p, local in snapshot.files.items() if p.removeprefix("ckpt/") in changed}
+        removed = sorted(f"ckpt/{path}" for path in set(synced_files) - set(files))
+
+    manifest_path = f"ckpt/{MANIFEST_NAME}"
+    manifest_local = snapshot.files.get(manifest_path)
+    upload.pop(manifest_path, None)
+    chunks = _chunked(upload, chunk_bytes)
+    total_bytes = sum(local.stat().st_size for local in upload.values())
+    done_files = 0
+    done_bytes = 0
+
+    api = None
+    if not dry_run:
         api = HfApi(token=os.getenv("HF_TOKEN"))
         api.create_repo(repo_id=repo_id, repo_type="model", exist_ok=True, private=True)
-        api.upload_folder(
-            repo_id=repo_id,
-            repo_type="model",
-            folder_path=str(snapshot_dir),
-            path_in_repo="",
-            revision=revision_branch,
-            commit_message="relay milestone snapshot",
-        )
-        info = api.model_info(repo_id=repo_id, revision=revision_branch)
-        revision = info.sha
-
-    payload = {
-        "repo": repo_id,
-        "revision": revision,
-        "at": _utc_now(),
-    }
-    last_synced.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+
+    revision = ""
+    for index, chunk in enumerate(chunks):
+        last = index == len(chunks) - 1
+        operations = [CommitOperationAdd(path_in_repo=p, path_or_fileobj=str(local)) for p, local in chunk.items()]
+        if last:
+            if manifest_local is not None:
+                operations.append(CommitOperationAdd(path_in_repo=manifest_path, path_or_fileobj=str(manifest_local)))
+            operations += [
+                CommitOperationAdd(path_in_repo=p, path_or_fileobj=data) for p, data in snapshot.blobs.items()
+            ]
+            operations += [CommitOperationDelete(path_in_repo=p) for p in removed]
+
+        if api is None:
+            revision = f"{DRY_RUN_PREFIX}{int(datetime.now(timezone.utc).timestamp())}"
+        else:
+            info = api.create_commit(
+                repo_id=repo_id,
+                repo_type="model",
+                operations=operations,
+                revision=revision_branch,
+                commit_message="relay milestone snapshot" if last else f"relay milestone snapshot (part {index + 1})",
+            )
+            revision = info.oid
+
+        for repo_path in chunk:
+            rel = repo_path.removeprefix("ckpt/")
+            if files is not None and rel in files:
+                synced_files[rel] = files[rel]
+        done_files += len(chunk)
+        done_bytes += sum(local.stat().st_size for local in chunk.values())
+        record = {"repo": repo_id, "branch": revision_branch, "revision": revision, "at": _utc_now()}
+        if not dry_run:
+            # A dry run uploads nothing, so it must not mark any file as synced.
+            record["files"] = files if last else synced_files
+        _write_last_synced(last_synced, record)
+        if progress is not None:
+            progress(
+                {
+                    "files": done_files,
+                    "total_files": len(upload),
+                    "bytes": done_bytes,
+                    "total_bytes": total_bytes,
+                    "revision": revision,
+                }
+            )
     return revision
+
+
+def push_checkpoint(
+    latest_ckpt: Path,
+    run_root: Path,
+    repo_id: str,
+    revision_branch: str = "main",
+    dry_run: bool = False,
+    delta: bool = False,
+    chunk_bytes: int | None = None,
+    progress: Callable[[dict], None] | None = None,
+    telemetry: "Telemetry | None" = None,
+) -> str:
+    """Snapshot `latest_ckpt` (symlinks resolved at call time) and sync it to `repo_id`."""
+    with maybe_span(telemetry, "hf_snapshot", checkpoint=latest_ckpt.resolve().name):
+        snapshot = make_snapshot(latest_ckpt.resolve(), run_root)
+    try:
+        return sync_snapshot(
+            snapshot,
+            run_root,
+            repo_id,
+            revision_branch=revision_branch,
+            dry_run=dry_run,
+            delta=delta,
+            chunk_bytes=chunk_bytes,
+            progress=progress,
+        )
+    finally:
+        snapshot.cleanup()
+
+
+@dataclass
+class HfSyncResult:
+    step_name: str
+    revision: str | None = None
+    error: str | None = None
+
+
+class HfSyncWorker:
+    """Background HF milestone uploader; the worker loop only calls `enqueue` and `poll`.
+
+    Pending milestones coalesce to the newest one. Each upload is a chunked delta sync, retried
+    with exponential backoff; because every chunk updates `hf/last_synced.json`, a retry (or the
+    next worker after a preemption) only uploads what is still missing. Start, progress, retry
+    and completion are written to `events.log` (through `events`, the worker's batched writer,
+    when given). On start it sweeps snapshot dirs an earlier,
+    killed upload left behind.
+    """
+
+    def __init__(
+        self,
+        run_root: Path,
+        repo_id: str,
+        revision_branch: str = "main",
+        dry_run: bool = False,
+        delta: bool = True,
+        chunk_bytes: int | None = 2 * 1024**3,
+        max_attempts: int = 5,
+        backoff_sec: float = 30.0,
+        max_backoff_sec: float = 900.0,
+        telemetry: "Telemetry | None" = None,
+        events: "Telemetry | None" = None,
+    ):
+        self.run_root = run_root
+        self.repo_id = repo_id
+        self.telemetry = telemetry
+        self.events = events
+        self.revision_branch = revision_branch
+        self.dry_run = dry_run
+        self.delta = delta
+        self.chunk_bytes = chunk_bytes
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_sec = backoff_sec
+        self.max_backoff_sec = max_backoff_sec
+        self._cond = threading.Condition()
+        self._pending: Path | None = None
+        self._busy = False
+        self._stop = False
+        self._results: list[HfSyncResult] = []
+        self._thread = threading.Thread(target=self._run, name="relay-hf-sync", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, ckpt: Path) -> None:
+        """Queue `ckpt` (resolved when the upload starts), replacing any not yet started milestone."""
+        with self._cond:
+            self._pending = ckpt
+            self._cond.notify_all()
+
+    def poll(self) -> list[HfSyncResult]:
+        with self._cond:
+            results, self._results = self._results, []
+        return results
+
+    @property
+    def idle(self) -> bool:
+        with self._cond:
+            return self._pending is None and not self._busy
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending is None and not self._busy, timeout)
+
+    def close(self, timeout: float | None = None) -> None:
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        removed = sweep_stale_snapshots(self.run_root)
+        if removed:
+            log_event(self.events, self.run_root, "hf_snapshot_swept", count=removed)
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stop or self._pending is not None)
+                if self._stop:
+                    return
+                target, self._pending = self._pending, None
+                self._busy = True
+            result = None
+            try:
+                result = self._sync(target)
+            except Exception as exc:
+                result = HfSyncResult(step_name=target.name, error=str(exc))
+            finally:
+                with self._cond:
+                    if result is not None:
+                        self._results.append(result)
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _sync(self, target: Path) -> HfSyncResult | None:
+        step_dir = target.resolve()
+        step_name = step_dir.name
+        log_event(self.events, self.run_root, "hf_sync_started", repo=self.repo_id, checkpoint=step_name)
+
+        def progress(info: dict) -> None:
+            log_event(self.events, self.run_root, "hf_sync_progress", repo=self.repo_id, checkpoint=step_name, **info)
+
+        error = ""
+        for attempt in range(self.max_attempts):
+            if self.events is not None:
+                # The snapshot captures events.log; write out what is still buffered first.
+                with suppress(OSError):
+                    self.events.flush()
+            try:
+                with maybe_span(self.telemetry, "hf_upload", checkpoint=step_name, attempt=attempt + 1):
+                    revision = push_checkpoint(
+                        step_dir,
+                        self.run_root,
+                        self.repo_id,
+                        revision_branch=self.revision_branch,
+                        dry_run=self.dry_run,
+                        delta=self.delta,
+                        chunk_bytes=self.chunk_bytes,
+                        progress=progress,
+                        telemetry=self.telemetry,
+                    )
+            except Exception as exc:
+                error = str(exc)
+            else:
+                log_event(
+                    self.events, self.run_root, "hf_synced", repo=self.repo_id, checkpoint=step_name, revision=revision
+                )
+                return HfSyncResult(step_name=step_name, revision=revision)
+            if attempt == self.max_attempts - 1:
+                break
+            delay = min(self.max_backoff_sec, self.backoff_sec * (2**attempt))
+            log_event(
+                self.events,
+                self.run_root,
+                "hf_sync_retry",
+                repo=self.repo_id,
+                checkpoint=step_name,
+                attempt=attempt + 1,
+                delay_sec=delay,
+                error=error,
+            )
+            with self._cond:
+                # A newer milestone supersedes this one; stop retrying and upload that instead.
+                if self._cond.wait_for(lambda: self._stop or self._pending is not None, delay):
+                    return None
+        log_event(self.events, self.run_root, "hf_sync_failed", repo=self.repo_id, checkpoint=step_name, error=error)
+        return HfSyncResult(step_name=step_name, error=error)
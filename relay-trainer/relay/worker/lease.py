@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import threading
+
+from relay.common.http import HttpClient
+from relay.worker.telemetry import Telemetry, maybe_span
+
+LEASE_LOST_CODES = (403, 409)
+
+
+class LeaseKeeper:
+    """Heartbeats the lease on a background thread for as long as the worker holds it.
+
+    The control loop blocks in resume verification, prefetch, the final checkpoint drain and the
+    final HF upload; heartbeating from here keeps the commander's liveness sweeper from releasing
+    the lease meanwhile. The loop publishes progress with `update`. A 409/403 answer means the
+    lease was released or re-granted, so `lost` is set and the worker must stop without
+    publishing anything. Uses its own HttpClient, since the control loop's session is not shared
+    across threads.
+    """
+
+    def __init__(
+        self,
+        commander_url: str,
+        run_id: str,
+        lease_token: str,
+        interval_sec: float = 45.0,
+        telemetry: Telemetry | None = None,
+    ):
+        self.client = HttpClient(base_url=commander_url)
+        self.run_id = run_id
+        self.lease_token = lease_token
+        self.interval_sec = interval_sec
+        self.telemetry = telemetry
+        self.lost_code: int | None = None
+        self._progress: dict = {}
+        self._lock = threading.Lock()
+        self._lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="relay-lease-keeper", daemon=True)
+
+    def start(self) -> "LeaseKeeper":
+        self._thread.start()
+        return self
+
+    def update(self, **progress) -> None:
+        """Set the step/latest_ckpt/hf_revision sent with the next heartbeat."""
+        with self._lock:
+            self._progress.update(progress)
+
+    @property
+    def lost(self) -> bool:
+        return self._lost.is_set()
+
+    def beat(self) -> None:
+        with self._lock:
+            payload = {"run_id": self.run_id, "lease_token": self.lease_token, **self._progress}
+        with maybe_span(self.telemetry, "heartbeat") as span:
+            resp = self.client.post("/api/lease/heartbeat", payload)
+            span["code"] = resp.status_code
+        if resp.status_code in LEASE_LOST_CODES:
+            self.lost_code = resp.status_code
+            self._lost.set()
+
+    def close(self, timeout: float | None = None) -> None:
+        """Stop heartbeating; call before the final report releases the lease."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        self.client.close()
+
+    def _run(self) -> None:
+        while not self._stop.is_set() and not self._lost.is_set():
+            try:
+                self.beat()
+            except Exception:
+                # Commander unreachable after retries; try again next interval.
+                pass
+            self._stop.wait(self.interval_sec)
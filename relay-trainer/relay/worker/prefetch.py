@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from relay.worker.ckpt import MANIFEST_NAME, load_manifest, log_event
+from relay.worker.telemetry import maybe_span
+
+if TYPE_CHECKING:
+    from relay.worker.telemetry import Telemetry
+
+READY_SUFFIX = ".ready"
+PARTIAL_SUFFIX = ".partial"
+
+
+def _copy_file(src: Path, dst: Path) -> int:
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(src, dst)
+    return dst.stat().st_size
+
+
+def copy_step_dir(src: Path, dst: Path, workers: int = 8) -> int:
+    """Copy a finalized step dir with `workers` parallel readers; returns bytes copied.
+
+    Sizes are checked against the manifest (the L1 copy was already verified on resume).
+    """
+    manifest = load_manifest(src)
+    if manifest is not None:
+        files = [(entry["path"], entry["size"]) for entry in manifest["files"]]
+        files.append((MANIFEST_NAME, None))
+    else:
+        files = [(p.relative_to(src).as_posix(), None) for p in sorted(src.rglob("*")) if p.is_file()]
+    # Largest first so one big shard does not start last and dominate the wall time.
+    files.sort(key=lambda item: -(item[1] or 0))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        sizes = list(pool.map(lambda item: _copy_file(src / item[0], dst / item[0]), files))
+    for (rel, expected), size in zip(files, sizes):
+        if expected is not None and size != expected:
+            raise OSError(f"short copy for {rel}: {size} != {expected}")
+    return sum(sizes)
+
+
+class ResumePrefetcher:
+    """Copies the resume checkpoint to local scratch while the trainer process starts.
+
+    The trainer is pointed at `dst` and must wait for `ready_file` before loading. The file
+    holds the path to load: `dst` once the copy is complete, or the L1 step dir if the copy
+    failed, so a prefetch problem never blocks a resume.
+    """
+
+    def __init__(
+        self,
+        src: Path,
+        local_root: Path,
+        run_root: Path,
+        workers: int = 8,
+        telemetry: "Telemetry | None" = None,
+        events: "Telemetry | None" = None,
+    ):
+        self.src = src
+        self.local_root = local_root
+        self.run_root = run_root
+        self.workers = workers
+        self.telemetry = telemetry
+        self.events = events
+        self.dst = local_root / src.name
+        self.ready_file = local_root / (src.name + READY_SUFFIX)
+        self.resume_path: Path | None = None
+        self._thread = threading.Thread(target=self._run, name="relay-resume-prefetch", daemon=True)
+
+    def start(self) -> "ResumePrefetcher":
+        self.local_root.mkdir(parents=True, exist_ok=True)
+        for entry in self.local_root.glob("step_*"):
+            # Scratch is sized for one checkpoint; drop older step copies and their .partial/.ready
+            # entries, leaving anything else in a shared local dir alone.
+            if entry in (self.dst, self.ready_file):
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
+        self._thread.start()
+        return self
+
+    def wait(self, timeout: float | None = None) -> Path | None:
+        self._thread.join(timeout)
+        return self.resume_path
+
+    def _mark_ready(self, path: Path) -> None:
+        tmp = self.ready_file.with_name(self.ready_file.name + ".tmp")
+        tmp.write_text(str(path), encoding="utf-8")
+        os.replace(tmp, self.ready_file)
+        self.resume_path = path
+
+    def _run(self) -> None:
+        if self.ready_file.exists() and self.dst.is_dir():
+            self._mark_ready(self.dst)
+            return
+        self.ready_file.unlink(missing_ok=True)
+        partial = self.local_root / (self.src.name + PARTIAL_SUFFIX)
+        shutil.rmtree(partial, ignore_errors=True)
+        shutil.rmtree(self.dst, ignore_errors=True)
+        try:
+            with maybe_span(self.telemetry, "resume_prefetch", checkpoint=self.src.name) as span:
+                span["bytes"] = copy_step_dir(self.src, partial, self.workers)
+            os.replace(partial, self.dst)
+        except Exception as exc:
+            shutil.rmtree(partial, ignore_errors=True)
+            log_event(self.events, self.run_root, "resume_prefetch_failed", checkpoint=self.src.name, error=str(exc))
+            self._mark_ready(self.src)
+            return
+        log_event(self.events, self.run_root, "resume_prefetched", checkpoint=self.src.name, local=str(self.dst))
+        self._mark_ready(self.dst)
@@ -3,7 +3,9 @@ from __future__ import annotations
 import os
 import signal
 import subprocess
+import time
 from dataclasses import dataclass
+from pathlib import Path
 
 
 @dataclass
@@ -30,3 +32,17 @@ def launch(cmd: list[str], env: dict[str, str], cwd: str | None = None) -> Manag
 def send_usr1(proc: ManagedProcess) -> None:
     if proc.poll() is None:
         os.kill(proc.process.pid, signal.SIGUSR1)
+
+
+def request_emergency_ckpt(proc: ManagedProcess, marker: Path, timeout: float) -> str | None:
+    """SIGUSR1 the trainer and wait up to `timeout` for the step name it writes to `marker`."""
+    marker.unlink(missing_ok=True)
+    send_usr1(proc)
+    deadline = time.monotonic() + timeout
+    while not marker.exists() and proc.poll() is None and time.monotonic() < deadline:
+        time.sleep(0.1)
+    if not marker.exists():
+        return None
+    name = marker.read_text(encoding="utf-8").strip()
+    marker.unlink(missing_ok=True)
+    return name or None
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+
+class TrashReclaimer:
+    """Deletes checkpoint dirs parked in `ckpt/_trash` on a background thread.
+
+    Pruning only renames victims into the trash dir, so rotation stays O(1) on the critical path.
+    Deletion is throttled to `files_per_sec` (0 disables throttling) to keep the network volume
+    responsive for checkpoint writes, and whatever is left in the trash dir after a crash is
+    picked up again when the next reclaimer starts. `after_drain` runs once the trash dir is
+    empty, e.g. to garbage-collect object store blobs the deleted steps were the last users of.
+    """
+
+    def __init__(
+        self,
+        trash_root: Path,
+        files_per_sec: float = 500.0,
+        burst: int = 64,
+        after_drain: Callable[[], object] | None = None,
+    ):
+        self.trash_root = trash_root
+        self.files_per_sec = files_per_sec
+        self.burst = max(1, burst)
+        self.after_drain = after_drain
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._idle = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="relay-reclaimer", daemon=True)
+
+    def start(self) -> "TrashReclaimer":
+        self.trash_root.mkdir(parents=True, exist_ok=True)
+        self._wake.set()
+        self._thread.start()
+        return self
+
+    def wake(self) -> None:
+        self._idle.clear()
+        self._wake.set()
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        return self._idle.wait(timeout)
+
+    def close(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self._drain()
+                if self.after_drain is not None and not self._stop.is_set():
+                    self.after_drain()
+            except OSError:
+                # Retry on the next wake-up; entries stay in the trash dir.
+                pass
+            if not self._wake.is_set():
+                self._idle.set()
+
+    def _drain(self) -> None:
+        removed = 0
+        window_start = time.monotonic()
+        for entry in sorted(self.trash_root.iterdir()):
+            if self._stop.is_set():
+                return
+            if entry.is_dir() and not entry.is_symlink():
+                walker = os.walk(entry, topdown=False)
+            else:
+                walker = iter([(str(entry.parent), [], [entry.name])])
+            for parent, dirnames, filenames in walker:
+                for name in filenames:
+                    if self._stop.is_set():
+                        return
+                    try:
+                        os.unlink(os.path.join(parent, name))
+                    except FileNotFoundError:
+                        pass
+                    removed += 1
+                    if self.files_per_sec > 0 and removed % self.burst == 0:
+                        budget = removed / self.files_per_sec
+                        elapsed = time.monotonic() - window_start
+                        if budget > elapsed:
+                            time.sleep(budget - elapsed)
+                for name in dirnames:
+                    path = os.path.join(parent, name)
+                    if os.path.islink(path):
+                        os.unlink(path)
+                    else:
+                        os.rmdir(path)
+            if entry.is_dir() and not entry.is_symlink():
+                os.rmdir(entry)
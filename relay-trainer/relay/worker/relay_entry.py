@@ -4,7 +4,6 @@ import argparse
 import json
 import os
 import signal
-import subprocess
 import sys
 import time
 from pathlib import Path
@@ -12,15 +11,22 @@ from pathlib import Path
 import yaml
 
 from relay.common.http import HttpClient
+from relay.worker.cas import ObjectStore
 from relay.worker.ckpt import (
-    append_event,
     ensure_run_dirs,
     finalize_external_checkpoint,
     latest_valid_step,
+    open_event_log,
     write_state,
 )
-from relay.worker.hf_sync import make_snapshot, sync_snapshot
-from relay.worker.proc import launch
+from relay.worker.finalizer import CheckpointFinalizer
+from relay.worker.hf_sync import HfSyncWorker
+from relay.worker.lease import LeaseKeeper
+from relay.worker.prefetch import ResumePrefetcher
+from relay.worker.proc import launch, request_emergency_ckpt
+from relay.worker.reclaim import TrashReclaimer
+from relay.worker.telemetry import Telemetry
+from relay.worker.writeback import writeback_checkpoint
 
 STOP = False
 
@@ -65,58 +71,261 @@ def run() -> int:
     mode = get_env_or_cfg(cfg, "mode", "sft")
     hf_repo = get_env_or_cfg(cfg, "hf_repo", "")
     hf_dry_run = str(get_env_or_cfg(cfg, "hf_dry_run", "true")).lower() == "true"
+    hf_delta_sync = str(get_env_or_cfg(cfg, "hf_delta_sync", "true")).lower() == "true"
+    verify_mode = get_env_or_cfg(cfg, "verify_mode", "stat")
 
     client = HttpClient(base_url=commander_url)
     acquire_headers = {"X-Relay-Secret": shared_secret} if shared_secret else None
-    acquire_payload = {"worker_id": worker_id, "run_id": run_id, "cap": {"gpu": "cpu", "count": 0}}
-
+    # An empty or "auto" run_id lets the commander schedule any queued run that fits this pod.
+    cap = {"gpu": get_env_or_cfg(cfg, "gpu_type", "cpu"), "count": int(get_env_or_cfg(cfg, "gpu_count", 0))}
+    acquire_payload = {"worker_id": worker_id, "run_id": run_id if run_id not in ("", "auto") else None, "cap": cap}
+
+    # Long-poll: the commander holds the request until a lease frees up, so handoff is immediate.
+    acquire_wait = float(get_env_or_cfg(cfg, "acquire_wait_sec", 30))
+    acquire_payload["wait_sec"] = acquire_wait
+    acquire_started = time.monotonic()
+    acquire_attempts = 0
     while True:
+        started = time.monotonic()
+        acquire_attempts += 1
         try:
-            acquire = client.post("/api/lease/acquire", acquire_payload, headers=acquire_headers)
+            acquire = client.post(
+                "/api/lease/acquire", acquire_payload, headers=acquire_headers, timeout=acquire_wait + 15
+            )
             data = acquire.json()
             if data.get("status") == "granted":
                 break
-            time.sleep(5)
+            if time.monotonic() - started < 1:
+                # The commander answered without waiting (wait capped or unsupported).
+                time.sleep(5)
         except Exception:
             time.sleep(5)
 
     lease_token = data["lease_token"]
     worker_cfg = data["config"]
+    run_id = data.get("run_id") or run_id
+    mode = worker_cfg.get("mode") or mode
     l1_root = Path(worker_cfg["l1_root"]) / "runs" / run_id
     dirs = ensure_run_dirs(l1_root)
-
-    append_event(l1_root, "acquire", worker_id=worker_id, run_id=run_id)
-
-    valid = latest_valid_step(dirs["ckpt_root"])
+    events = open_event_log(l1_root)
+    telemetry = Telemetry(
+        l1_root / "telemetry" / f"{worker_id}.jsonl",
+        max_bytes=int(get_env_or_cfg(cfg, "telemetry_max_mb", 64)) * 1024 * 1024,
+        metrics_port=int(get_env_or_cfg(cfg, "telemetry_metrics_port", 0)),
+    )
+    telemetry.record("acquire_wait", time.monotonic() - acquire_started, run_id=run_id, attempts=acquire_attempts)
+    # Heartbeat from a background thread for the whole lease, so blocking phases (resume verify,
+    # prefetch, final drain and HF upload) never look like a dead worker to the commander.
+    heartbeat_interval = float(get_env_or_cfg(cfg, "heartbeat_interval_sec", 45))
+    keeper = LeaseKeeper(commander_url, run_id, lease_token, heartbeat_interval, telemetry=telemetry).start()
+
+    events.event("acquire", worker_id=worker_id, run_id=run_id)
+
+    with telemetry.span("resume_verify", mode=verify_mode) as span:
+        valid = latest_valid_step(dirs["ckpt_root"], mode=verify_mode)
+        span["checkpoint"] = valid.name if valid else None
     if valid is not None:
         resume_from = str(valid)
-        append_event(l1_root, "resume_l1", checkpoint=valid.name)
+        events.event("resume_l1", checkpoint=valid.name)
     else:
         resume_from = ""
-        append_event(l1_root, "resume_cold_start")
+        events.event("resume_cold_start")
 
     cmd = ["bash", "trainer_blackbox/launch_sft.sh" if mode == "sft" else "trainer_blackbox/launch_rl.sh"]
     env = os.environ.copy()
     env["RELAY_RUN_ROOT"] = str(l1_root)
-    env["RELAY_CKPT_STAGING_ROOT"] = str(dirs["staging_root"])
+    # Write-back: the trainer saves to fast local disk and the worker streams steps into L1.
+    writeback_dir = get_env_or_cfg(cfg, "writeback_local_dir", "")
+    trainer_staging = Path(writeback_dir) / run_id / "staging" if writeback_dir else dirs["staging_root"]
+    trainer_staging.mkdir(parents=True, exist_ok=True)
+    env["RELAY_CKPT_STAGING_ROOT"] = str(trainer_staging)
+    env["RELAY_CKPT_BACKPRESSURE_FILE"] = str(trainer_staging / ".backpressure")
     env["RELAY_RESUME_FROM"] = resume_from
+    # On SIGTERM the trainer gets SIGUSR1, saves a step and writes its name to this marker.
+    emergency_ckpt_sec = float(get_env_or_cfg(cfg, "emergency_ckpt_sec", 0))
+    if emergency_ckpt_sec > 0:
+        env["RELAY_EMERGENCY_MARKER"] = str(trainer_staging / ".emergency")
+    resume_local_dir = get_env_or_cfg(cfg, "resume_local_dir", "")
+    if valid is not None and resume_local_dir:
+        # Copy to local scratch while the trainer starts; it waits on the ready file before loading.
+        prefetcher = ResumePrefetcher(
+            valid,
+            Path(resume_local_dir) / run_id / "resume",
+            l1_root,
+            workers=int(get_env_or_cfg(cfg, "resume_prefetch_workers", 8)),
+            telemetry=telemetry,
+            events=events,
+        ).start()
+        env["RELAY_RESUME_FROM"] = str(prefetcher.dst)
+        env["RELAY_RESUME_READY_FILE"] = str(prefetcher.ready_file)
+        # If the ready file never shows up, the trainer gives up after this long and loads from L1.
+        env["RELAY_RESUME_L1"] = str(valid)
+        env["RELAY_RESUME_READY_TIMEOUT_SEC"] = str(int(get_env_or_cfg(cfg, "resume_ready_timeout_sec", 1800)))
+        if str(get_env_or_cfg(cfg, "resume_prefetch_overlap", "true")).lower() != "true":
+            env["RELAY_RESUME_FROM"] = str(prefetcher.wait())
+
+    finalizer = CheckpointFinalizer(
+        max_pending=int(get_env_or_cfg(cfg, "finalize_max_pending", 2)),
+        backpressure_file=Path(env["RELAY_CKPT_BACKPRESSURE_FILE"]),
+    )
+    drain_timeout = float(get_env_or_cfg(cfg, "finalize_drain_timeout_sec", 30))
+    ckpt_dedup = str(get_env_or_cfg(cfg, "ckpt_dedup", "false")).lower() == "true"
+    object_store = ObjectStore(l1_root / "objects") if ckpt_dedup else None
+    reclaimer = TrashReclaimer(
+        dirs["trash_root"],
+        files_per_sec=float(get_env_or_cfg(cfg, "reclaim_files_per_sec", 500)),
+        after_drain=object_store.gc if object_store is not None else None,
+    ).start()
+
+    if keeper.lost:
+        # Lost during resume verify/prefetch; the trainer was never started.
+        events.event("lease_lost", worker_id=worker_id, code=keeper.lost_code)
+        reclaimer.close(timeout=1)
+        keeper.close(timeout=1)
+        telemetry.close()
+        events.close()
+        return 3
 
     proc = launch(cmd, env=env, cwd=str(Path(__file__).resolve().parents[2]))
-    renew_interval = 45
-    report_interval = 90
     hf_interval = int(worker_cfg["hf_sync_interval_sec"])
     keep_last_n = int(worker_cfg["ckpt_keep_last_n"])
 
-    next_renew = 0.0
-    next_report = 0.0
     next_hf = time.time() + hf_interval
     last_step_name = valid.name if valid else None
     last_hf_revision = None
+    last_hf_step = None
+    failed_steps: set[str] = set()
+    hf_worker = None
+    if hf_repo:
+        hf_worker = HfSyncWorker(
+            l1_root,
+            hf_repo,
+            dry_run=hf_dry_run,
+            delta=hf_delta_sync,
+            chunk_bytes=int(get_env_or_cfg(cfg, "hf_sync_chunk_mb", 2048)) * 1024 * 1024,
+            telemetry=telemetry,
+            events=events,
+        )
+
+    # Once preempted, steps are published with stat-only manifests to fit the grace window.
+    fast_finalize = False
+
+    def finalize(staged: Path, hash_files: bool = True):
+        with telemetry.span("ckpt_finalize", checkpoint=staged.name, hashed=hash_files):
+            if staged.parent != dirs["staging_root"]:
+                return writeback_checkpoint(
+                    staged.parent,
+                    dirs["staging_root"],
+                    dirs["ckpt_root"],
+                    staged.name,
+                    keep_last_n,
+                    reclaimer,
+                    object_store,
+                    telemetry,
+                )
+            return finalize_external_checkpoint(
+                dirs["staging_root"],
+                dirs["ckpt_root"],
+                staged.name,
+                keep_last_n,
+                reclaimer,
+                object_store,
+                telemetry,
+                hash_files=hash_files,
+            )
+
+    def submit_staged() -> None:
+        # L1 staging may still hold steps a previous worker left behind.
+        roots = {trainer_staging, dirs["staging_root"]}
+        for staged in sorted((p for root in roots for p in root.glob("step_*")), key=lambda p: p.name):
+            if staged.name in failed_steps:
+                continue
+            if not finalizer.submit(f"ckpt:{staged.name}", finalize, staged, not fast_finalize):
+                break
+
+    def collect(done) -> None:
+        nonlocal last_step_name
+        for key, fut in done:
+            kind, _, name = key.partition(":")
+            exc = fut.exception()
+            if kind == "ckpt":
+                if exc is not None:
+                    # Leave the staging dir for the next worker instead of retrying it every tick.
+                    failed_steps.add(name)
+                    events.event("ckpt_finalize_failed", checkpoint=name, error=str(exc))
+                    continue
+                last_step_name = fut.result().name
+                events.event("ckpt_saved", checkpoint=last_step_name)
+                write_state(
+                    l1_root,
+                    {
+                        "status": "RUNNING",
+                        "latest_ckpt": last_step_name,
+                        "last_hf_revision": last_hf_revision,
+                        "updated_at": int(time.time()),
+                    },
+                )
+
+    def collect_hf() -> None:
+        nonlocal last_hf_revision, last_hf_step
+        if hf_worker is None:
+            return
+        for result in hf_worker.poll():
+            if result.revision:
+                last_hf_revision = result.revision
+                last_hf_step = result.step_name
+
+    def finish_staged(timeout: float | None) -> None:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            submit_staged()
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if finalizer.pending == 0 or keeper.lost or (remaining is not None and remaining <= 0):
+                return
+            collect(finalizer.wait_any(heartbeat_interval if remaining is None else remaining))
+
+    def lease_lost() -> int:
+        # The lease was released (maybe swept and re-granted); another worker may own the run dir
+        # now, so stop the trainer and exit without finalizing, writing state or reporting.
+        events.event("lease_lost", worker_id=worker_id, code=keeper.lost_code)
+        proc.terminate()
+        finalizer.shutdown()
+        reclaimer.close(timeout=1)
+        if hf_worker is not None:
+            hf_worker.close(timeout=1)
+        keeper.close(timeout=1)
+        telemetry.close()
+        events.close()
+        return 3
+
+    def progress() -> None:
+        keeper.update(
+            step=int((last_step_name or "step_0").split("_")[-1]),
+            latest_ckpt=last_step_name,
+            hf_revision=last_hf_revision,
+        )
 
     while True:
         now = time.time()
         if STOP:
-            append_event(l1_root, "sigterm")
+            events.event("sigterm")
+            fast_finalize = True
+            if emergency_ckpt_sec > 0 and proc.poll() is None:
+                with telemetry.span("emergency_ckpt") as span:
+                    span["checkpoint"] = request_emergency_ckpt(
+                        proc, Path(env["RELAY_EMERGENCY_MARKER"]), emergency_ckpt_sec
+                    )
+                events.event("emergency_ckpt", checkpoint=span["checkpoint"])
+            finish_staged(drain_timeout)
+            if keeper.lost:
+                return lease_lost()
+            finalizer.shutdown()
+            reclaimer.close(timeout=1)
+            if hf_worker is not None:
+                # An interrupted upload resumes from hf/last_synced.json on the next worker.
+                collect_hf()
+                hf_worker.close(timeout=1)
+            keeper.close(timeout=1)
             write_state(
                 l1_root,
                 {
@@ -127,77 +336,61 @@ def run() -> int:
                 },
             )
             try:
-                client.post(
-                    "/api/job/report",
-                    {
-                        "lease_token": lease_token,
-                        "run_id": run_id,
-                        "step": int((last_step_name or "step_0").split("_")[-1]),
-                        "latest_ckpt": last_step_name,
-                        "status": "PREEMPTED",
-                        "hf": {"last_synced": bool(last_hf_revision), "repo": hf_repo, "revision": last_hf_revision},
-                    },
-                )
+                with telemetry.span("report", status="PREEMPTED"):
+                    client.post(
+                        "/api/job/report",
+                        {
+                            "lease_token": lease_token,
+                            "run_id": run_id,
+                            "step": int((last_step_name or "step_0").split("_")[-1]),
+                            "latest_ckpt": last_step_name,
+                            "status": "PREEMPTED",
+                            "hf": {
+                                "last_synced": bool(last_hf_revision),
+                                "repo": hf_repo,
+                                "revision": last_hf_revision,
+                            },
+                        },
+                    )
             except Exception:
                 pass
             proc.terminate()
+            telemetry.close()
+            events.close()
             return 0
 
-        for staged in sorted(dirs["staging_root"].glob("step_*")):
-            step_name = staged.name
-            final = finalize_external_checkpoint(dirs["staging_root"], dirs["ckpt_root"], step_name, keep_last_n)
-            last_step_name = final.name
-            append_event(l1_root, "ckpt_saved", checkpoint=last_step_name)
-            write_state(
-                l1_root,
-                {
-                    "status": "RUNNING",
-                    "latest_ckpt": last_step_name,
-                    "last_hf_revision": last_hf_revision,
-                    "updated_at": int(now),
-                },
-            )
-
-        if now >= next_renew:
-            client.post("/api/lease/renew", {"lease_token": lease_token, "worker_id": worker_id})
-            next_renew = now + renew_interval
+        submit_staged()
+        collect(finalizer.poll())
 
-        if now >= next_report:
-            step = int((last_step_name or "step_0").split("_")[-1])
-            client.post(
-                "/api/job/report",
-                {
-                    "lease_token": lease_token,
-                    "run_id": run_id,
-                    "step": step,
-                    "latest_ckpt": last_step_name,
-                    "status": "RUNNING",
-                    "hf": {"last_synced": bool(last_hf_revision), "repo": hf_repo or None, "revision": last_hf_revision},
-                },
-            )
-            next_report = now + report_interval
+        progress()
+        if keeper.lost:
+            return lease_lost()
 
-        if hf_repo and last_step_name and now >= next_hf:
-            latest = dirs["ckpt_root"] / last_step_name
-            snapshot = make_snapshot(latest, l1_root)
-            try:
-                last_hf_revision = sync_snapshot(snapshot, l1_root, hf_repo, dry_run=hf_dry_run)
-                append_event(l1_root, "hf_synced", repo=hf_repo, revision=last_hf_revision)
-            finally:
-                subprocess.run(["rm", "-rf", str(snapshot.parent)], check=False)
+        collect_hf()
+        if hf_worker is not None and last_step_name and now >= next_hf:
+            hf_worker.enqueue(dirs["ckpt_root"] / "latest")
             next_hf = now + hf_interval
 
         code = proc.poll()
         if code is not None:
             final_status = "COMPLETED" if code == 0 else "FAILED"
-            if hf_repo and last_step_name and not last_hf_revision:
-                latest = dirs["ckpt_root"] / last_step_name
-                snapshot = make_snapshot(latest, l1_root)
-                try:
-                    last_hf_revision = sync_snapshot(snapshot, l1_root, hf_repo, dry_run=hf_dry_run)
-                    append_event(l1_root, "hf_synced", repo=hf_repo, revision=last_hf_revision)
-                finally:
-                    subprocess.run(["rm", "-rf", str(snapshot.parent)], check=False)
+            # The trainer may have staged its last step after this tick's scan.
+            finish_staged(None)
+            if keeper.lost:
+                return lease_lost()
+            finalizer.shutdown()
+            if hf_worker is not None:
+                collect_hf()
+                if last_step_name and last_hf_step != last_step_name:
+                    hf_worker.enqueue(dirs["ckpt_root"] / "latest")
+                while not keeper.lost and not hf_worker.wait_idle(timeout=1):
+                    pass
+                if keeper.lost:
+                    return lease_lost()
+                collect_hf()
+                hf_worker.close(timeout=1)
+            reclaimer.close(timeout=1)
+            keeper.close(timeout=1)
             write_state(
                 l1_root,
                 {
@@ -209,19 +402,26 @@ def run() -> int:
                 },
             )
             try:
-                client.post(
-                    "/api/job/report",
-                    {
-                        "lease_token": lease_token,
-                        "run_id": run_id,
-                        "step": int((last_step_name or "step_0").split("_")[-1]),
-                        "latest_ckpt": last_step_name,
-                        "status": final_status,
-                        "hf": {"last_synced": bool(last_hf_revision), "repo": hf_repo or None, "revision": last_hf_revision},
-                    },
-                )
+                with telemetry.span("report", status=final_status):
+                    client.post(
+                        "/api/job/report",
+                        {
+                            "lease_token": lease_token,
+                            "run_id": run_id,
+                            "step": int((last_step_name or "step_0").split("_")[-1]),
+                            "latest_ckpt": last_step_name,
+                            "status": final_status,
+                            "hf": {
+                                "last_synced": bool(last_hf_revision),
+                                "repo": hf_repo or None,
+                                "revision": last_hf_revision,
+                            },
+                        },
+                    )
             except Exception:
                 pass
+            telemetry.close()
+            events.close()
             return code
 
         time.sleep(2)
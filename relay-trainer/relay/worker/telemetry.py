@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator
+
+from relay.common.metrics import CONTENT_TYPE, Registry
+
+logger = logging.getLogger("relay.worker.telemetry")
+
+PHASE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+
+class Telemetry:
+    """Timed relay phases written as JSONL, batched and rotated, optionally scraped over HTTP.
+
+    Each record carries wall-clock `ts`, monotonic `mono` and, for spans, `duration_sec`
+    measured on the monotonic clock. Records are buffered and appended by a background
+    thread every `flush_interval_sec` (or once `batch_size` are pending); the file rotates
+    to `<name>.1..N` past `max_bytes` (0 = never). While writes fail, at most `max_buffered`
+    records are kept and the oldest are dropped and counted. With `metrics_port`, phase
+    durations are served as Prometheus histograms on 127.0.0.1.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        flush_interval_sec: float = 2.0,
+        batch_size: int = 256,
+        max_bytes: int = 64 * 1024 * 1024,
+        backups: int = 3,
+        metrics_port: int = 0,
+        max_buffered: int = 65536,
+    ):
+        self.path = path
+        self.flush_interval_sec = flush_interval_sec
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.max_buffered = max_buffered
+        self.dropped = 0
+        self._buffer: list[str] = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.metrics = Registry()
+        self._durations = self.metrics.histogram(
+            "relay_worker_phase_duration_seconds", "Duration of relay worker phases", ("phase",), PHASE_BUCKETS
+        )
+        self._errors = self.metrics.counter(
+            "relay_worker_phase_errors_total", "Failed relay worker phases", ("phase",)
+        )
+        self._dropped = self.metrics.counter(
+            "relay_worker_telemetry_dropped_total", "Telemetry records dropped while writes failed"
+        )
+        self._server: ThreadingHTTPServer | None = None
+        if metrics_port:
+            self._server = _serve_metrics(self.metrics, metrics_port)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="relay-telemetry", daemon=True)
+        self._thread.start()
+
+    def event(self, name: str, **fields) -> None:
+        record = {"ts": time.time(), "mono": time.monotonic(), "event": name, **fields}
+        line = json.dumps(record, ensure_ascii=True, default=str)
+        with self._lock:
+            self._buffer.append(line)
+            full = len(self._buffer) >= self.batch_size
+            self._trim_locked()
+        if full:
+            self._wake.set()
+
+    def record(self, name: str, duration_sec: float, ok: bool = True, **fields) -> None:
+        self._durations.observe(duration_sec, phase=name)
+        if not ok:
+            self._errors.inc(phase=name)
+        self.event(name, duration_sec=round(duration_sec, 6), ok=ok, **fields)
+
+    @contextmanager
+    def span(self, name: str, **fields) -> Iterator[dict]:
+        """Time the block; fields added to the yielded dict are recorded with the span."""
+        started = time.monotonic()
+        try:
+            yield fields
+        except BaseException as exc:
+            self.record(name, time.monotonic() - started, ok=False, error=str(exc) or type(exc).__name__, **fields)
+            raise
+        self.record(name, time.monotonic() - started, **fields)
+
+    def flush(self) -> None:
+        with self._write_lock:
+            with self._lock:
+                lines, self._buffer = self._buffer, []
+            if not lines:
+                return
+            data = ("\n".join(lines) + "\n").encode("utf-8")
+            try:
+                try:
+                    size = self.path.stat().st_size
+                except FileNotFoundError:
+                    size = 0
+                if self.max_bytes and size and size + len(data) > self.max_bytes:
+                    self._rotate()
+                with self.path.open("ab") as f:
+                    f.write(data)
+            except OSError:
+                # Put the batch back ahead of newer records so the next flush retries it.
+                with self._lock:
+                    self._buffer[:0] = lines
+                    self._trim_locked()
+                raise
+
+    def _trim_locked(self) -> None:
+        excess = len(self._buffer) - self.max_buffered
+        if excess > 0:
+            del self._buffer[:excess]
+            self.dropped += excess
+            self._dropped.inc(excess)
+
+    def _rotate(self) -> None:
+        for i in range(self.backups, 0, -1):
+            src = self.path if i == 1 else self.path.with_name(f"{self.path.name}.{i - 1}")
+            if src.exists():
+                os.replace(src, self.path.with_name(f"{self.path.name}.{i}"))
+        if self.backups == 0:
+            self.path.unlink(missing_ok=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval_sec)
+            self._wake.clear()
+            try:
+                self.flush()
+            except OSError:
+                # Keep training; flush() re-queued the batch, so the next one retries it.
+                pass
+
+    def close(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        try:
+            self.flush()
+        except OSError as exc:
+            # Shutdown must not fail on telemetry; the unwritten records are lost.
+            logger.warning("final flush to %s failed, %d records lost: %s", self.path, len(self._buffer), exc)
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def _serve_metrics(registry: Registry, port: int) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, name="relay-telemetry-http", daemon=True).start()
+    return server
+
+
+def maybe_span(telemetry: Telemetry | None, name: str, **fields):
+    """`telemetry.span(...)`, or a no-op when telemetry is disabled."""
+    return telemetry.span(name, **fields) if telemetry is not None else nullcontext(fields)
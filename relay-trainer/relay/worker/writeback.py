@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from relay.worker.ckpt import (
+    HASH_CHUNK_BYTES,
+    HASH_WORKERS,
+    MANIFEST_NAME,
+    VERIFIED_NAME,
+    finalize_external_checkpoint,
+)
+from relay.worker.telemetry import maybe_span
+
+if TYPE_CHECKING:
+    from relay.worker.cas import ObjectStore
+    from relay.worker.reclaim import TrashReclaimer
+    from relay.worker.telemetry import Telemetry
+
+
+def _copy_hashing(src: Path, dst: Path) -> str:
+    """Copy `src` to `dst`, hashing the bytes on the way through, and fsync the result."""
+    h = sha256()
+    buf = bytearray(HASH_CHUNK_BYTES)
+    view = memoryview(buf)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    with src.open("rb") as fin, dst.open("wb") as fout:
+        while n := fin.readinto(buf):
+            h.update(view[:n])
+            fout.write(view[:n])
+        fout.flush()
+        os.fsync(fout.fileno())
+    return h.hexdigest()
+
+
+def _fsync_dir(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def copy_with_manifest(src: Path, dst: Path, workers: int | None = None) -> dict:
+    """Copy a step dir durably and return its manifest, hashed during the copy (no re-read)."""
+    rels = [
+        p.relative_to(src).as_posix()
+        for p in sorted(src.rglob("*"))
+        if p.is_file() and p.name not in (MANIFEST_NAME, VERIFIED_NAME)
+    ]
+    # Largest first so one big shard does not start last and dominate the wall time.
+    order = sorted(rels, key=lambda rel: -(src / rel).stat().st_size)
+    with ThreadPoolExecutor(max_workers=workers or HASH_WORKERS) as pool:
+        digests = dict(zip(order, pool.map(lambda rel: _copy_hashing(src / rel, dst / rel), order)))
+    files = []
+    for rel in rels:
+        st = (dst / rel).stat()
+        if st.st_size != (src / rel).stat().st_size:
+            raise OSError(f"short write-back copy for {rel}")
+        files.append(
+            {"path": rel, "size": st.st_size, "sha256": digests[rel], "mtime_ns": st.st_mtime_ns, "inode": st.st_ino}
+        )
+    for path in sorted({(dst / rel).parent for rel in rels} | {dst}, reverse=True):
+        _fsync_dir(path)
+    return {"file_count": len(files), "files": files}
+
+
+def writeback_checkpoint(
+    local_staging: Path,
+    l1_staging: Path,
+    ckpt_root: Path,
+    step_name: str,
+    keep_last_n: int,
+    reclaimer: "TrashReclaimer | None" = None,
+    object_store: "ObjectStore | None" = None,
+    telemetry: "Telemetry | None" = None,
+    workers: int | None = None,
+) -> Path:
+    """Stream a step the trainer saved to local disk into L1, then finalize it there.
+
+    The copy lands in a hidden dir under the L1 staging root (never picked up as a staged step),
+    is fsynced, and only then renamed into staging and finalized, so `latest` never points at
+    a partial write-back. The local copy is removed once the L1 step is published.
+    """
+    src = local_staging / step_name
+    if not src.exists():
+        raise FileNotFoundError(f"local staging checkpoint missing: {src}")
+    partial = l1_staging / f".writeback-{step_name}"
+    staged = l1_staging / step_name
+    shutil.rmtree(partial, ignore_errors=True)
+    with maybe_span(telemetry, "ckpt_writeback", checkpoint=step_name) as span:
+        manifest = copy_with_manifest(src, partial, workers)
+        span["bytes"] = sum(item["size"] for item in manifest["files"])
+    shutil.rmtree(staged, ignore_errors=True)
+    os.replace(partial, staged)
+    _fsync_dir(l1_staging)
+    dst = finalize_external_checkpoint(
+        l1_staging, ckpt_root, step_name, keep_last_n, reclaimer, object_store, telemetry, manifest=manifest
+    )
+    shutil.rmtree(src, ignore_errors=True)
+    return dst
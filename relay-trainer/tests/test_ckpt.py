@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import os
+import time
+from hashlib import sha256
+from pathlib import Path
+
+from relay.worker import ckpt
+
+
+def _write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def test_manifest_hashes_and_reuses_unchanged_files(tmp_path: Path, monkeypatch):
+    prev = tmp_path / "step_00000001"
+    _write(prev / "shard.bin", b"a" * 4096)
+    _write(prev / "sub" / "empty.txt", b"")
+    first = ckpt.save_manifest(prev)
+    assert first["file_count"] == 2
+    assert {item["path"]: item["sha256"] for item in first["files"]} == {
+        "shard.bin": sha256(b"a" * 4096).hexdigest(),
+        "sub/empty.txt": sha256(b"").hexdigest(),
+    }
+
+    cur = tmp_path / "step_00000002"
+    cur.mkdir()
+    os.link(prev / "shard.bin", cur / "shard.bin")
+    _write(cur / "new.bin", b"b" * 10)
+
+    hashed: list[str] = []
+    real = ckpt._file_sha256
+    monkeypatch.setattr(ckpt, "_file_sha256", lambda path: hashed.append(path.name) or real(path))
+    second = ckpt.build_manifest(cur, previous=first)
+    assert hashed == ["new.bin"]
+    assert [item["path"] for item in second["files"]] == ["new.bin", "shard.bin"]
+    assert second["files"][1]["sha256"] == sha256(b"a" * 4096).hexdigest()
+
+    # Saving again must not list the manifest itself.
+    ckpt.save_manifest(cur, previous=first)
+    assert ckpt.verify_step_dir(cur)
+
+
+def test_stat_verify_uses_cache_and_falls_back_to_hash(tmp_path: Path, monkeypatch):
+    staging = tmp_path / "ckpt" / "_staging"
+    ckpt_root = tmp_path / "ckpt"
+    _write(staging / "step_00000001" / "weights.bin", b"w" * 128)
+    final = ckpt.finalize_external_checkpoint(staging, ckpt_root, "step_00000001", keep_last_n=3)
+    assert (final / ckpt.VERIFIED_NAME).exists()
+
+    monkeypatch.setattr(ckpt, "_file_sha256", lambda path: (_ for _ in ()).throw(AssertionError("hashed")))
+    assert ckpt.latest_valid_step(ckpt_root) == final
+    monkeypatch.undo()
+
+    # Same size, new content and mtime: the cache no longer matches and full hashing rejects it.
+    (final / "weights.bin").write_bytes(b"x" * 128)
+    os.utime(final / "weights.bin", ns=(1, 1))
+    assert not ckpt.verify_step_dir(final, mode="stat")
+    assert ckpt.latest_valid_step(ckpt_root) is None
+
+
+def test_finalizer_bounds_queue_and_signals_backpressure(tmp_path: Path):
+    import threading
+
+    from relay.worker.finalizer import CheckpointFinalizer
+
+    marker = tmp_path / ".backpressure"
+    gate = threading.Event()
+    finalizer = CheckpointFinalizer(max_pending=2, backpressure_file=marker)
+    try:
+        assert finalizer.submit("a", gate.wait)
+        assert not marker.exists()
+        assert finalizer.submit("b", lambda: "b")
+        assert finalizer.submit("b", lambda: "dup")
+        assert marker.exists()
+        assert not finalizer.submit("c", lambda: "c")
+
+        gate.set()
+        done = finalizer.drain(timeout=5)
+        assert [key for key, _ in done] == ["a", "b"]
+        assert done[1][1].result() == "b"
+        assert not marker.exists()
+    finally:
+        finalizer.shutdown()
+
+
+def test_prune_renames_into_trash_and_reclaimer_resumes(tmp_path: Path):
+    from relay.worker.reclaim import TrashReclaimer
+
+    ckpt_root = tmp_path / "ckpt"
+    for step in range(1, 4):
+        _write(ckpt_root / f"step_{step:08d}" / "nested" / "shard.bin", b"s")
+    leftover = ckpt_root / ckpt.TRASH_DIR / "step_00000000.deadbeef"
+    _write(leftover / "shard.bin", b"old")
+
+    trashed = ckpt.prune_old_ckpt(ckpt_root, keep_last_n=1, reclaimer=None)
+    assert [p.name.split(".")[0] for p in trashed] == ["step_00000001", "step_00000002"]
+    assert [p.name for p in ckpt.list_step_dirs(ckpt_root)] == ["step_00000003"]
+    assert not any(p.exists() for p in trashed)
+    assert leftover.exists()
+
+    _write(ckpt_root / "step_00000004" / "shard.bin", b"s")
+    reclaimer = TrashReclaimer(ckpt_root / ckpt.TRASH_DIR, files_per_sec=0).start()
+    try:
+        ckpt.prune_old_ckpt(ckpt_root, keep_last_n=1, reclaimer=reclaimer)
+        assert [p.name for p in ckpt.list_step_dirs(ckpt_root)] == ["step_00000004"]
+        deadline = time.time() + 5
+        while any((ckpt_root / ckpt.TRASH_DIR).iterdir()) and time.time() < deadline:
+            reclaimer.wait_idle(0.1)
+        assert list((ckpt_root / ckpt.TRASH_DIR).iterdir()) == []
+    finally:
+        reclaimer.close(timeout=5)
+
+
+def test_object_store_dedups_identical_files_and_gcs_unreferenced(tmp_path: Path):
+    from relay.worker.cas import ObjectStore
+
+    store = ObjectStore(tmp_path / "objects")
+    staging = tmp_path / "ckpt" / "_staging"
+    ckpt_root = tmp_path / "ckpt"
+    for step, shard in [(1, b"frozen"), (2, b"frozen")]:
+        _write(staging / f"step_{step:08d}" / "tokenizer.json", b"{}")
+        _write(staging / f"step_{step:08d}" / "shard.bin", shard + bytes([step]))
+        ckpt.finalize_external_checkpoint(staging, ckpt_root, f"step_{step:08d}", keep_last_n=2, object_store=store)
+
+    first, second = ckpt.list_step_dirs(ckpt_root)
+    assert (first / "tokenizer.json").stat().st_ino == (second / "tokenizer.json").stat().st_ino
+    assert (first / "shard.bin").stat().st_ino != (second / "shard.bin").stat().st_ino
+    assert ckpt.verify_step_dir(second, mode="full")
+    blob = store.path_for(sha256(b"frozen\x01").hexdigest())
+    assert blob.stat().st_nlink == 2
+
+    _write(staging / "step_00000003" / "tokenizer.json", b"{}")
+    _write(staging / "step_00000003" / "shard.bin", b"frozen\x03")
+    ckpt.finalize_external_checkpoint(staging, ckpt_root, "step_00000003", keep_last_n=2, object_store=store)
+    assert not blob.exists()
+    assert store.path_for(sha256(b"{}").hexdigest()).stat().st_nlink == 3
+
+
+def test_resume_prefetcher_copies_to_local_scratch(tmp_path: Path):
+    import json
+
+    from relay.worker.ckpt import MANIFEST_NAME
+    from relay.worker.prefetch import ResumePrefetcher
+
+    run_root = tmp_path / "run"
+    step = run_root / "ckpt" / "step_00000002"
+    (step / "shards").mkdir(parents=True)
+    (step / "shards" / "a.bin").write_bytes(b"a" * 1000)
+    (step / "config.json").write_text("{}", encoding="utf-8")
+    ckpt.save_manifest(step)
+    local = tmp_path / "nvme" / "run"
+    (local / "step_00000001").mkdir(parents=True)
+    (local / "step_00000001.ready").write_text("x", encoding="utf-8")
+    (local / "staging" / "step_00000003").mkdir(parents=True)
+
+    prefetcher = ResumePrefetcher(step, local, run_root, workers=4).start()
+    assert prefetcher.wait(timeout=10) == local / "step_00000002"
+    assert prefetcher.ready_file.read_text(encoding="utf-8") == str(local / "step_00000002")
+    assert (local / "step_00000002" / "shards" / "a.bin").read_bytes() == b"a" * 1000
+    assert (local / "step_00000002" / MANIFEST_NAME).exists()
+    assert not (local / "step_00000001").exists()
+    assert not (local / "step_00000001.ready").exists()
+    # Other local data, e.g. write-back staging sharing the dir, is left alone.
+    assert (local / "staging" / "step_00000003").is_dir()
+
+    # A copy that does not match the manifest falls back to resuming from L1.
+    manifest = json.loads((step / MANIFEST_NAME).read_text(encoding="utf-8"))
+    manifest["files"][0]["size"] += 1
+    (step / MANIFEST_NAME).write_text(json.dumps(manifest), encoding="utf-8")
+    prefetcher.ready_file.unlink()
+    retry = ResumePrefetcher(step, local, run_root).start()
+    assert retry.wait(timeout=10) == step
+    assert retry.ready_file.read_text(encoding="utf-8") == str(step)
+    assert not (local / "step_00000002").exists()
+
+
+def test_writeback_streams_local_step_into_l1_with_manifest(tmp_path: Path):
+    from relay.worker.writeback import writeback_checkpoint
+
+    local = tmp_path / "nvme" / "staging"
+    dirs = ckpt.ensure_run_dirs(tmp_path / "run")
+    _write(local / "step_00000003" / "model.bin", b"m" * 5000)
+    _write(local / "step_00000003" / "opt" / "state.bin", b"o" * 10)
+
+    dst = writeback_checkpoint(local, dirs["staging_root"], dirs["ckpt_root"], "step_00000003", 2, workers=2)
+
+    assert dst == dirs["ckpt_root"] / "step_00000003"
+    assert (dirs["ckpt_root"] / "latest").resolve() == dst
+    assert not (local / "step_00000003").exists()
+    assert not list(dirs["staging_root"].iterdir())
+    manifest = ckpt.load_manifest(dst)
+    by_path = {item["path"]: item for item in manifest["files"]}
+    assert by_path["model.bin"]["sha256"] == sha256(b"m" * 5000).hexdigest()
+    assert by_path["opt/state.bin"]["inode"] == (dst / "opt" / "state.bin").stat().st_ino
+    assert ckpt.verify_step_dir(dst, mode="full")
+    assert ckpt.verify_step_dir(dst, mode="stat")
+
+
+def test_stat_only_manifest_reuses_known_digests(tmp_path: Path):
+    prev = tmp_path / "step_00000001"
+    _write(prev / "same.bin", b"s" * 100)
+    first = ckpt.save_manifest(prev)
+    cur = tmp_path / "step_00000002"
+    cur.mkdir()
+    os.link(prev / "same.bin", cur / "same.bin")
+    _write(cur / "new.bin", b"n" * 100)
+
+    manifest = ckpt.build_manifest(cur, previous=first, hash_files=False)
+    digests = {item["path"]: item["sha256"] for item in manifest["files"]}
+    assert digests == {"new.bin": None, "same.bin": sha256(b"s" * 100).hexdigest()}
+    ckpt.write_manifest(cur, manifest)
+    assert ckpt.verify_step_dir(cur, mode="full")
+    _write(cur / "new.bin", b"n" * 99)
+    assert not ckpt.verify_step_dir(cur, mode="full")
+
+
+def test_emergency_checkpoint_round_trip_with_mock_trainer(tmp_path: Path):
+    import subprocess
+    import sys
+
+    from relay.worker.proc import ManagedProcess, request_emergency_ckpt
+
+    staging = tmp_path / "staging"
+    marker = staging / ".emergency"
+    env = {**os.environ, "RELAY_EMERGENCY_MARKER": str(marker)}
+    trainer = Path(__file__).resolve().parents[1] / "trainer_blackbox" / "mock_trainer.py"
+    args = ["--mode", "sft", "--max-steps", "30", "--save-every", "100", "--staging-root", str(staging)]
+    proc = ManagedProcess(subprocess.Popen([sys.executable, str(trainer), *args], env=env))
+    try:
+        time.sleep(0.5)
+        name = request_emergency_ckpt(proc, marker, timeout=10)
+    finally:
+        proc.terminate()
+        proc.process.wait(timeout=10)
+
+    assert name is not None and name.startswith("step_")
+    assert (staging / name / "metrics.json").exists()
+    assert not marker.exists()
@@ -41,3 +41,247 @@ def test_lease_lifecycle():
         },
     )
     assert report.status_code == 200
+
+
+def test_sqlite_store_persists_rows_and_round_trips_json(tmp_path):
+    from datetime import datetime, timezone
+
+    from relay.commander_store import JsonStateStore, SqliteStateStore, open_state_store
+    from relay.common.schema import ActiveLease, RunStatus
+
+    db = tmp_path / "state.db"
+    store = open_state_store(db)
+    assert isinstance(store, SqliteStateStore)
+    store.state.leases["r1"] = ActiveLease(
+        run_id="r1", lease_token="t", worker_id="w1", expires_at=datetime.now(timezone.utc)
+    )
+    store.state.run_status["r1"] = RunStatus(run_id="r1", last_reported_step=5)
+    store.state.run_status["r2"] = RunStatus(run_id="r2", status="COMPLETED")
+    store.save(["r1"])
+
+    reopened = open_state_store(db)
+    assert reopened.state.leases["r1"].lease_token == "t"
+    assert list(reopened.state.run_status) == ["r1"]
+    assert reopened.state.run_status["r1"].last_reported_step == 5
+
+    store.save()
+    assert open_state_store(db).state.run_status["r2"].status == "COMPLETED"
+
+    exported = tmp_path / "state.json"
+    store.export_json(exported)
+    json_store = open_state_store(exported)
+    assert isinstance(json_store, JsonStateStore)
+    assert set(json_store.state.run_status) == {"r1", "r2"}
+
+    fresh = open_state_store(tmp_path / "fresh.sqlite")
+    fresh.import_json(exported)
+    assert set(open_state_store(tmp_path / "fresh.sqlite").state.run_status) == {"r1", "r2"}
+
+
+def test_scheduler_runs_concurrent_leases_by_priority_and_cap():
+    commander_app.store.state = CommanderState()
+    commander_app.store.save()
+    client = TestClient(commander_app.app)
+
+    client.post("/api/runs/submit", json={"run_id": "low", "mode": "sft"})
+    client.post("/api/runs/submit", json={"run_id": "high", "mode": "rl", "priority": 5})
+    client.post("/api/runs/submit", json={"run_id": "big", "priority": 9, "gpu": "h100", "gpu_count": 8})
+
+    cpu = {"gpu": "cpu", "count": 0}
+    first = client.post("/api/lease/acquire", json={"worker_id": "w1", "cap": cpu}).json()
+    assert (first["status"], first["run_id"], first["config"]["mode"]) == ("granted", "high", "rl")
+    second = client.post("/api/lease/acquire", json={"worker_id": "w2", "cap": cpu}).json()
+    assert (second["status"], second["run_id"]) == ("granted", "low")
+    assert client.post("/api/lease/acquire", json={"worker_id": "w3", "cap": cpu}).json()["status"] == "denied"
+
+    gpu = client.post("/api/lease/acquire", json={"worker_id": "w4", "cap": {"gpu": "H100", "count": 8}}).json()
+    assert gpu["run_id"] == "big"
+    assert set(commander_app.store.state.leases) == {"high", "low", "big"}
+
+    renew = client.post(
+        "/api/lease/renew", json={"lease_token": first["lease_token"], "worker_id": "w1", "run_id": "high"}
+    )
+    assert renew.status_code == 200
+    done = {"lease_token": first["lease_token"], "run_id": "high", "step": 1, "status": "COMPLETED"}
+    assert client.post("/api/job/report", json=done).status_code == 200
+    assert "high" not in commander_app.store.state.leases
+    assert commander_app.store.state.run_status["high"].usage_sec >= 0.0
+    # Completed runs are never rescheduled.
+    assert client.post("/api/lease/acquire", json={"worker_id": "w5", "cap": cpu}).json()["status"] == "denied"
+
+
+def test_fair_share_prefers_least_used_run():
+    from datetime import datetime, timezone
+
+    from relay.common.schema import RunSpec, RunStatus
+    from relay.scheduler import pick_run
+
+    state = CommanderState(
+        runs={"a": RunSpec(run_id="a"), "b": RunSpec(run_id="b", weight=4.0)},
+        run_status={"a": RunStatus(run_id="a", usage_sec=100.0), "b": RunStatus(run_id="b", usage_sec=200.0)},
+    )
+    assert pick_run(state, None, datetime.now(timezone.utc)) == "b"
+    assert CommanderState.model_validate({"active_lease": None}).leases == {}
+
+
+def test_journal_store_replays_appends_and_compacts(tmp_path):
+    from datetime import datetime, timezone
+
+    from relay.commander_store import JournalStateStore, open_state_store
+    from relay.common.schema import ActiveLease, RunStatus
+
+    path = tmp_path / "state.json"
+    store = open_state_store(path, "journal")
+    assert isinstance(store, JournalStateStore)
+    store.state.leases["r1"] = ActiveLease(
+        run_id="r1", lease_token="t", worker_id="w1", expires_at=datetime.now(timezone.utc)
+    )
+    store.state.run_status["r1"] = RunStatus(run_id="r1", last_reported_step=1)
+    store.save(["r1"])
+    store.state.run_status["r1"].last_reported_step = 2
+    store.save(["r1"])
+    del store.state.leases["r1"]
+    store.save(["r1"])
+    store.close()
+    assert not path.exists()
+    assert len(store.journal_path.read_text(encoding="utf-8").splitlines()) == 3
+
+    # A torn append from a crash is dropped on recovery.
+    with store.journal_path.open("a", encoding="utf-8") as f:
+        f.write('{"run_id": "r1", "leases"')
+    reopened = JournalStateStore(path, compact_every=2)
+    assert reopened.state.leases == {}
+    assert reopened.state.run_status["r1"].last_reported_step == 2
+
+    reopened.state.run_status["r2"] = RunStatus(run_id="r2")
+    reopened.save(["r2"])
+    reopened.close()
+    assert reopened.journal_path.read_bytes() == b""
+    assert set(open_state_store(path).state.run_status) == {"r1", "r2"}
+
+
+def test_journal_group_commit_waits_for_fsync_outside_the_lock(tmp_path, monkeypatch):
+    import time
+
+    from relay import commander_store
+    from relay.common.schema import RunStatus
+
+    store = commander_store.JournalStateStore(tmp_path / "state.json", fsync_interval_sec=0.2)
+    real_fsync = commander_store.os.fsync
+    lock_held = []
+
+    def fsync(fd):
+        lock_held.append(store.lock.locked())
+        real_fsync(fd)
+
+    monkeypatch.setattr(commander_store.os, "fsync", fsync)
+    with store.lock:
+        store.state.run_status["r1"] = RunStatus(run_id="r1")
+        store.save(["r1"])
+    started = time.monotonic()
+    store.wait_durable()
+    assert time.monotonic() - started >= 0.1
+    assert lock_held == [False]
+    store.wait_durable()  # nothing new written by this thread
+    store.close()
+
+
+def test_heartbeat_persists_only_on_transitions(monkeypatch):
+    commander_app.store.state = CommanderState()
+    commander_app.store.save()
+    client = TestClient(commander_app.app)
+    token = client.post("/api/lease/acquire", json={"worker_id": "w1", "run_id": "hb"}).json()["lease_token"]
+
+    saves = []
+    monkeypatch.setattr(commander_app.store, "save", lambda run_ids=None: saves.append(run_ids))
+    beat = {"run_id": "hb", "lease_token": token, "step": 1, "latest_ckpt": None}
+    for step in range(1, 4):
+        assert client.post("/api/lease/heartbeat", json={**beat, "step": step}).status_code == 200
+    assert saves == []
+    assert commander_app.store.state.run_status["hb"].last_reported_step == 3
+
+    client.post("/api/lease/heartbeat", json={**beat, "latest_ckpt": "step_00000003"})
+    assert saves == [["hb"]]
+    assert client.post("/api/lease/heartbeat", json={**beat, "lease_token": "bad"}).status_code == 403
+
+
+def test_long_poll_acquire_wakes_on_release():
+    import threading
+    import time
+
+    commander_app.store.state = CommanderState()
+    commander_app.store.save()
+    client = TestClient(commander_app.app)
+    holder = client.post("/api/lease/acquire", json={"worker_id": "w1", "run_id": "lp"}).json()
+
+    waited = {}
+
+    def standby():
+        started = time.monotonic()
+        resp = client.post("/api/lease/acquire", json={"worker_id": "w2", "run_id": "lp", "wait_sec": 20}).json()
+        waited.update(resp, elapsed=time.monotonic() - started)
+
+    thread = threading.Thread(target=standby)
+    thread.start()
+    time.sleep(0.5)
+    assert not waited
+    preempted = {"lease_token": holder["lease_token"], "run_id": "lp", "step": 2, "status": "PREEMPTED"}
+    released_at = time.monotonic()
+    assert client.post("/api/job/report", json=preempted).status_code == 200
+    thread.join(timeout=10)
+
+    assert waited["status"] == "granted"
+    assert waited["elapsed"] < 5
+    assert time.monotonic() - released_at < 2
+    assert commander_app.store.state.leases["lp"].worker_id == "w2"
+
+
+def test_sweeper_releases_silent_lease_and_wakes_standby(monkeypatch):
+    import time
+
+    monkeypatch.setattr(commander_app, "LIVENESS_TIMEOUT_SEC", 0.5)
+    monkeypatch.setattr(commander_app, "SWEEP_INTERVAL_SEC", 0.05)
+    commander_app.store.state = CommanderState()
+    commander_app.store.save()
+
+    with TestClient(commander_app.app) as client:
+        holder = client.post("/api/lease/acquire", json={"worker_id": "w1", "run_id": "sw"}).json()
+        started = time.monotonic()
+        standby = client.post("/api/lease/acquire", json={"worker_id": "w2", "run_id": "sw", "wait_sec": 10}).json()
+        elapsed = time.monotonic() - started
+
+        assert standby["status"] == "granted"
+        assert 0.4 < elapsed < 3
+        assert commander_app.store.state.run_status["sw"].status == "PREEMPTED"
+        assert "no heartbeat" in commander_app.store.state.run_status["sw"].msg
+        beat = {"run_id": "sw", "lease_token": holder["lease_token"]}
+        assert client.post("/api/lease/heartbeat", json=beat).status_code == 403
+
+
+def test_metrics_endpoint_reports_routes_handoffs_and_step_rate():
+    commander_app.store.state = CommanderState()
+    commander_app.store.save()
+    client = TestClient(commander_app.app)
+    holder = client.post("/api/lease/acquire", json={"worker_id": "w1", "run_id": "m1"}).json()
+    for step in (10, 20):
+        client.post("/api/lease/heartbeat", json={"run_id": "m1", "lease_token": holder["lease_token"], "step": step})
+    preempted = {"lease_token": holder["lease_token"], "run_id": "m1", "step": 20, "status": "PREEMPTED"}
+    client.post("/api/job/report", json=preempted)
+    handoffs_before = commander_app.HANDOFFS._values.get((), 0)
+    second = client.post("/api/lease/acquire", json={"worker_id": "w2", "run_id": "m1"}).json()
+
+    resp = client.get("/metrics")
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = resp.text
+    route = 'route="/api/lease/heartbeat",method="POST",code="200"'
+    assert f"relay_commander_request_duration_seconds_count{{{route}}}" in text
+    assert "relay_commander_lock_wait_seconds_count" in text
+    assert "relay_commander_state_save_duration_seconds_count" in text
+    assert "relay_commander_active_leases " in text
+    assert commander_app.HANDOFFS._values[()] == handoffs_before + 1
+    assert 'relay_run_step{run_id="m1"} 20' in text
+    assert 'relay_run_step_rate{run_id="m1"}' in text
+
+    completed = {"lease_token": second["lease_token"], "run_id": "m1", "step": 30, "status": "COMPLETED"}
+    client.post("/api/job/report", json=completed)
+    assert 'run_id="m1"' not in client.get("/metrics").text
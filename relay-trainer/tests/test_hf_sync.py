@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+from relay.worker import hf_sync
+from relay.worker.ckpt import save_manifest
+
+
+class FakeApi:
+    calls: list[dict] = []
+
+    def __init__(self, token=None):
+        del token
+
+    def create_repo(self, **kwargs):
+        return None
+
+    def create_commit(self, **kwargs):
+        FakeApi.calls.append(kwargs)
+        return SimpleNamespace(oid=f"rev{len(FakeApi.calls)}")
+
+
+def _ops(call: dict) -> tuple[list[str], list[str]]:
+    adds = sorted(op.path_in_repo for op in call["operations"] if isinstance(op, hf_sync.CommitOperationAdd))
+    deletes = sorted(op.path_in_repo for op in call["operations"] if isinstance(op, hf_sync.CommitOperationDelete))
+    return adds, deletes
+
+
+def _step(run_root: Path, name: str, files: dict[str, bytes]) -> Path:
+    step = run_root / "ckpt" / name
+    for rel, data in files.items():
+        (step / rel).parent.mkdir(parents=True, exist_ok=True)
+        (step / rel).write_bytes(data)
+    save_manifest(step)
+    return step
+
+
+def test_delta_sync_uploads_only_changed_files(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(hf_sync, "HfApi", FakeApi)
+    FakeApi.calls = []
+    run_root = tmp_path / "run"
+
+    first = _step(run_root, "step_00000001", {"config.json": b"{}", "model.bin": b"1", "old.bin": b"x"})
+    (run_root / "events.log").write_text('{"event": "acquire"}\n', encoding="utf-8")
+    assert hf_sync.push_checkpoint(first, run_root, "u/r", delta=True) == "rev1"
+    assert _ops(FakeApi.calls[0]) == (
+        ["ckpt/config.json", "ckpt/manifest.json", "ckpt/model.bin", "ckpt/old.bin", "events.log"],
+        [],
+    )
+    assert not list((run_root / "hf").glob("relay_hf_snapshot_*"))
+
+    second = _step(run_root, "step_00000002", {"config.json": b"{}", "model.bin": b"2"})
+    assert hf_sync.push_checkpoint(second, run_root, "u/r", delta=True) == "rev2"
+    assert _ops(FakeApi.calls[1]) == (["ckpt/manifest.json", "ckpt/model.bin", "events.log"], ["ckpt/old.bin"])
+
+    recorded = json.loads((run_root / "hf" / "last_synced.json").read_text(encoding="utf-8"))
+    assert set(recorded["files"]) == {"config.json", "model.bin"}
+
+    # A different repo never reuses the recorded manifest.
+    hf_sync.push_checkpoint(second, run_root, "u/other", delta=True)
+    assert _ops(FakeApi.calls[2])[0] == ["ckpt/config.json", "ckpt/manifest.json", "ckpt/model.bin", "events.log"]
+
+
+def test_real_delta_sync_after_dry_run_uploads_every_file(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(hf_sync, "HfApi", FakeApi)
+    FakeApi.calls = []
+    run_root = tmp_path / "run"
+    step = _step(run_root, "step_00000001", {"config.json": b"{}", "model.bin": b"1"})
+
+    assert hf_sync.push_checkpoint(step, run_root, "u/r", dry_run=True, delta=True).startswith("dry-run-")
+    assert FakeApi.calls == []
+    recorded = json.loads((run_root / "hf" / "last_synced.json").read_text(encoding="utf-8"))
+    assert "files" not in recorded
+
+    # Records written before dry runs stopped recording files are ignored as well.
+    manifest = json.loads((step / "manifest.json").read_text(encoding="utf-8"))
+    recorded["files"] = {item["path"]: item["sha256"] for item in manifest["files"]}
+    (run_root / "hf" / "last_synced.json").write_text(json.dumps(recorded), encoding="utf-8")
+
+    hf_sync.push_checkpoint(step, run_root, "u/r", delta=True)
+    assert _ops(FakeApi.calls[0]) == (["ckpt/config.json", "ckpt/manifest.json", "ckpt/model.bin"], [])
+
+
+def test_snapshot_pins_checkpoint_files_without_copying(tmp_path: Path):
+    run_root = tmp_path / "run"
+    step = _step(run_root, "step_00000001", {"model.bin": b"m" * 64})
+    (run_root / "state.json").write_text("{}", encoding="utf-8")
+
+    snapshot = hf_sync.make_snapshot(step, run_root)
+    try:
+        pinned = snapshot.files["ckpt/model.bin"]
+        assert pinned.stat().st_ino == (step / "model.bin").stat().st_ino
+        assert snapshot.blobs == {"state.json": b"{}"}
+        assert not (snapshot.root / "state.json").exists()
+    finally:
+        snapshot.cleanup()
+    assert not snapshot.root.exists()
+
+
+def test_sync_worker_retries_and_logs_progress(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(hf_sync, "HfApi", FakeApi)
+    FakeApi.calls = []
+    run_root = tmp_path / "run"
+    step = _step(run_root, "step_00000001", {"a.bin": b"a" * 10, "b.bin": b"b" * 10})
+    (run_root / "ckpt" / "latest").symlink_to(step.name)
+
+    real_push = hf_sync.push_checkpoint
+    attempts = []
+
+    def flaky_push(*args, **kwargs):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("boom")
+        return real_push(*args, **kwargs)
+
+    monkeypatch.setattr(hf_sync, "push_checkpoint", flaky_push)
+    worker = hf_sync.HfSyncWorker(run_root, "u/r", chunk_bytes=10, backoff_sec=0.01)
+    try:
+        worker.enqueue(run_root / "ckpt" / "latest")
+        assert worker.wait_idle(timeout=10)
+        [result] = worker.poll()
+    finally:
+        worker.close(timeout=5)
+
+    assert result.step_name == "step_00000001"
+    assert result.revision == "rev2"
+    # One commit per 10-byte chunk; manifest and run files ride with the last one.
+    assert [_ops(call)[0] for call in FakeApi.calls] == [
+        ["ckpt/a.bin"],
+        ["ckpt/b.bin", "ckpt/manifest.json", "events.log"],
+    ]
+    events = [json.loads(line)["event"] for line in (run_root / "events.log").read_text(encoding="utf-8").splitlines()]
+    assert events == [
+        "hf_sync_started",
+        "hf_sync_retry",
+        "hf_sync_progress",
+        "hf_sync_progress",
+        "hf_synced",
+    ]
+
+
+def test_worker_sweeps_snapshots_left_by_a_killed_upload(tmp_path: Path):
+    run_root = tmp_path / "run"
+    step = _step(run_root, "step_00000001", {"a.bin": b"a" * 8})
+    stale = hf_sync.make_snapshot(step, run_root)
+    (run_root / "hf" / "last_synced.json").write_text("{}", encoding="utf-8")
+    assert (stale.root / "a.bin").stat().st_nlink == 2
+
+    worker = hf_sync.HfSyncWorker(run_root, "u/r", dry_run=True)
+    worker.close(timeout=5)
+
+    assert not stale.root.exists()
+    assert (step / "a.bin").stat().st_nlink == 1
+    assert (run_root / "hf" / "last_synced.json").exists()
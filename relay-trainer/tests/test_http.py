@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from relay.common.http import AsyncHttpClient, HttpClient
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections: set[int] = set()
+    failures_left = 0
+
+    def do_POST(self):
+        _Handler.connections.add(id(self.connection))
+        self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        status = 200
+        if _Handler.failures_left > 0:
+            _Handler.failures_left -= 1
+            status = 503
+        body = b'{"ok": true}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        return
+
+
+@pytest.fixture()
+def server():
+    _Handler.connections = set()
+    _Handler.failures_left = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_http_client_reuses_connection_and_retries(server):
+    client = HttpClient(base_url=server, backoff_sec=0.01)
+    _Handler.failures_left = 1
+    for _ in range(3):
+        assert client.post("/api/lease/renew", {"lease_token": "t"}).json() == {"ok": True}
+    client.close()
+    assert len(_Handler.connections) == 1
+
+
+def test_async_http_client_retries(server):
+    pytest.importorskip("httpx")
+
+    async def main():
+        async with AsyncHttpClient(base_url=server, backoff_sec=0.01) as client:
+            _Handler.failures_left = 2
+            resp = await client.post("/api/job/report", {"step": 1})
+            return resp.status_code
+
+    assert asyncio.run(main()) == 200
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import time
+from types import SimpleNamespace
+
+from relay.worker.lease import LeaseKeeper
+
+
+def test_lease_keeper_heartbeats_in_background_until_lost():
+    keeper = LeaseKeeper("http://commander.invalid", "r1", "tok", interval_sec=0.05)
+    sent = []
+
+    def post(path, payload):
+        sent.append((path, payload))
+        return SimpleNamespace(status_code=409 if len(sent) >= 3 else 200)
+
+    keeper.client.post = post
+    keeper.update(step=7, latest_ckpt="step_00000007")
+    keeper.start()
+    # The control loop is free to block; heartbeats keep going until the commander says 409.
+    end = time.monotonic() + 5
+    while not keeper.lost and time.monotonic() < end:
+        time.sleep(0.01)
+    keeper.close(timeout=1)
+
+    assert keeper.lost and keeper.lost_code == 409
+    assert len(sent) == 3
+    assert sent[0] == (
+        "/api/lease/heartbeat",
+        {"run_id": "r1", "lease_token": "tok", "step": 7, "latest_ckpt": "step_00000007"},
+    )
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from relay.common.metrics import Registry
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    hits = registry.counter("hits_total", "Hits", ("route",))
+    latency = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    registry.gauge("queue_depth", "Depth", func=lambda: 3)
+
+    hits.inc(route='/a"b')
+    hits.inc(2, route='/a"b')
+    latency.observe(0.05, route="/x")
+    latency.observe(0.5, route="/x")
+    latency.observe(5, route="/x")
+
+    text = registry.render()
+    assert "# TYPE hits_total counter" in text
+    assert 'hits_total{route="/a\\"b"} 3' in text
+    assert 'latency_seconds_bucket{route="/x",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/x",le="1"} 2' in text
+    assert 'latency_seconds_bucket{route="/x",le="+Inf"} 3' in text
+    assert 'latency_seconds_sum{route="/x"} 5.55' in text
+    assert 'latency_seconds_count{route="/x"} 3' in text
+    assert "queue_depth 3" in text
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import json
+import socket
+from pathlib import Path
+
+import pytest
+import requests
+
+from relay.worker.ckpt import finalize_external_checkpoint, log_event, open_event_log
+from relay.worker.telemetry import Telemetry
+
+
+def _records(path: Path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_spans_are_batched_and_rotated(tmp_path: Path):
+    path = tmp_path / "telemetry" / "w1.jsonl"
+    telemetry = Telemetry(path, flush_interval_sec=60, max_bytes=400, backups=1)
+    with telemetry.span("resume_verify", mode="stat") as span:
+        span["checkpoint"] = "step_00000001"
+    with pytest.raises(RuntimeError):
+        with telemetry.span("heartbeat"):
+            raise RuntimeError("down")
+    assert not path.exists()
+
+    telemetry.flush()
+    first, second = _records(path)
+    assert first["event"] == "resume_verify" and first["checkpoint"] == "step_00000001" and first["ok"]
+    assert first["duration_sec"] >= 0 and first["mono"] <= second["mono"]
+    assert second == {**second, "event": "heartbeat", "ok": False, "error": "down"}
+
+    for i in range(5):
+        telemetry.event("tick", i=i)
+        telemetry.flush()
+    telemetry.close()
+    assert path.with_name("w1.jsonl.1").exists()
+    assert not path.with_name("w1.jsonl.2").exists()
+    assert path.stat().st_size <= 400
+
+
+def test_failed_flush_keeps_records_for_the_next_one(tmp_path: Path):
+    path = tmp_path / "w1.jsonl"
+    telemetry = Telemetry(path, flush_interval_sec=60)
+    telemetry.event("first")
+    path.mkdir()  # opening a directory for append fails like a full or read-only disk
+    with pytest.raises(OSError):
+        telemetry.flush()
+
+    path.rmdir()
+    telemetry.event("second")
+    telemetry.close()
+    assert [r["event"] for r in _records(path)] == ["first", "second"]
+
+
+def test_buffer_is_capped_while_writes_fail(tmp_path: Path):
+    path = tmp_path / "w1.jsonl"
+    telemetry = Telemetry(path, flush_interval_sec=60, batch_size=1000, max_buffered=3)
+    path.mkdir()
+    for i in range(5):
+        telemetry.event("tick", i=i)
+        with pytest.raises(OSError):
+            telemetry.flush()
+    assert telemetry.dropped == 2
+    assert "relay_worker_telemetry_dropped_total 2\n" in telemetry.metrics.render()
+
+    # Shutdown on a disk that is still unwritable logs instead of raising.
+    telemetry.event("last")
+    telemetry.close()
+    path.rmdir()
+    telemetry.flush()
+    assert [r["i"] for r in _records(path) if r["event"] == "tick"] == [3, 4]
+
+
+def test_event_log_is_batched_and_monotonic(tmp_path: Path):
+    events = open_event_log(tmp_path)
+    events.event("acquire", worker_id="w1")
+    log_event(events, tmp_path, "ckpt_saved", checkpoint="step_00000001")
+    assert not (tmp_path / "events.log").exists()
+
+    events.close()
+    log_event(None, tmp_path, "resume_cold_start")
+    records = _records(tmp_path / "events.log")
+    assert [r["event"] for r in records] == ["acquire", "ckpt_saved", "resume_cold_start"]
+    assert records[0]["mono"] <= records[1]["mono"] <= records[2]["mono"]
+
+
+def test_finalize_spans_and_metrics_port(tmp_path: Path):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    telemetry = Telemetry(tmp_path / "t.jsonl", metrics_port=port)
+    staging, ckpt_root = tmp_path / "staging", tmp_path / "ckpt"
+    (staging / "step_00000001").mkdir(parents=True)
+    (staging / "step_00000001" / "model.bin").write_bytes(b"x" * 8)
+    ckpt_root.mkdir()
+    try:
+        finalize_external_checkpoint(staging, ckpt_root, "step_00000001", 2, telemetry=telemetry)
+        text = requests.get(f"http://127.0.0.1:{port}/metrics", timeout=5).text
+    finally:
+        telemetry.close()
+
+    assert 'relay_worker_phase_duration_seconds_count{phase="ckpt_manifest"} 1' in text
+    events = {r["event"]: r for r in _records(tmp_path / "t.jsonl")}
+    assert events["ckpt_manifest"]["files"] == 1 and events["ckpt_manifest"]["bytes"] == 8
+    assert "ckpt_prune" in events
@@ -85,3 +85,52 @@ def test_worker_sft_and_rl(tmp_path: Path):
     finally:
         commander.terminate()
         commander.wait(timeout=10)
+
+
+def test_worker_stops_when_lease_is_taken_over(tmp_path: Path):
+    env = os.environ.copy()
+    env["PYTHONPATH"] = str(Path.cwd())
+    env["RELAY_COMMANDER_STATE"] = str(tmp_path / "commander_state.json")
+    l1_root = tmp_path / "mnt" / "relay"
+    env["RELAY_L1_ROOT"] = str(l1_root)
+
+    commander = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "relay.commander_app:app", "--port", "18083"],
+        cwd=str(Path.cwd()),
+        env=env,
+    )
+    try:
+        wait_health("http://127.0.0.1:18083")
+        cfg = {"commander_url": "http://127.0.0.1:18083", "run_id": "run-lost", "worker_id": "worker-1"}
+        cfg_path = tmp_path / "run.yaml"
+        cfg_path.write_text(yaml.safe_dump(cfg), encoding="utf-8")
+
+        worker_env = os.environ.copy()
+        worker_env["PYTHONPATH"] = str(Path.cwd())
+        worker_env["MOCK_MAX_STEPS"] = "60"
+        worker_env["RELAY_L1_ROOT"] = str(l1_root)
+        worker_env["HEARTBEAT_INTERVAL_SEC"] = "1"
+        worker = subprocess.Popen(
+            [sys.executable, "-m", "relay.worker.relay_entry", "--config", str(cfg_path)],
+            cwd=str(Path.cwd()),
+            env=worker_env,
+        )
+        try:
+            events = l1_root / "runs" / "run-lost" / "events.log"
+            end = time.time() + 30
+            while time.time() < end and "ckpt_saved" not in (events.read_text() if events.exists() else ""):
+                time.sleep(0.5)
+            takeover = requests.post(
+                "http://127.0.0.1:18083/api/lease/acquire",
+                json={"worker_id": "worker-2", "run_id": "run-lost", "force": True},
+                timeout=10,
+            )
+            assert takeover.json()["status"] == "granted"
+            assert worker.wait(timeout=60) == 3
+        finally:
+            worker.kill()
+        assert "lease_lost" in events.read_text(encoding="utf-8")
+        assert '"status": "COMPLETED"' not in (l1_root / "runs" / "run-lost" / "state.json").read_text()
+    finally:
+        commander.terminate()
+        commander.wait(timeout=10)
@@ -4,7 +4,7 @@ from pathlib import Path
 
 import typer
 
-from relay.worker.hf_sync import make_snapshot, sync_snapshot
+from relay.worker.hf_sync import push_checkpoint
 
 app = typer.Typer(help="Push latest relay checkpoint to Hugging Face")
 
@@ -15,18 +15,12 @@ def main(
     repo_id: str = typer.Option(..., help="HF model repo id"),
     branch: str = typer.Option("main", help="Target branch"),
     dry_run: bool = typer.Option(False, help="Do not upload, only generate revision metadata"),
+    delta: bool = typer.Option(False, help="Only upload files changed since hf/last_synced.json"),
 ) -> None:
     root = Path(run_root)
-    latest = root / "ckpt" / "latest"
-    if latest.is_symlink():
-        latest = latest.resolve()
-    snapshot = make_snapshot(latest, root)
-    try:
-        revision = sync_snapshot(snapshot, root, repo_id=repo_id, revision_branch=branch, dry_run=dry_run)
-    finally:
-        import shutil
-
-        shutil.rmtree(snapshot.parent, ignore_errors=True)
+    revision = push_checkpoint(
+        root / "ckpt" / "latest", root, repo_id=repo_id, revision_branch=branch, dry_run=dry_run, delta=delta
+    )
     typer.echo(revision)
 
 
@@ -23,10 +23,13 @@ def serve(
     state_path: str = "./commander_state.json",
     lease_seconds: int = 3600,
     shared_secret: str = "",
+    backend: str = typer.Option("", help="State backend: json, sqlite or journal (default: by state path suffix)"),
 ) -> None:
     os.environ["RELAY_COMMANDER_STATE"] = state_path
     os.environ["RELAY_LEASE_SECONDS"] = str(lease_seconds)
     os.environ["RELAY_SHARED_SECRET"] = shared_secret
+    if backend:
+        os.environ["RELAY_COMMANDER_BACKEND"] = backend
     import uvicorn
 
     uvicorn.run("relay.commander_app:app", host=host, port=port)
@@ -38,13 +41,52 @@ def status(commander_url: str = "http://127.0.0.1:8080", state_path: str = "") -
         path = Path(state_path)
         if not path.exists():
             raise typer.BadParameter(f"state file not found: {state_path}")
-        typer.echo(path.read_text(encoding="utf-8"))
+        from relay.commander_store import open_state_store
+
+        typer.echo(open_state_store(path).state.model_dump_json(indent=2))
         return
     health = requests.get(commander_url.rstrip("/") + "/api/health", timeout=10)
     health.raise_for_status()
     typer.echo(json.dumps(health.json(), indent=2))
 
 
+@app.command()
+def submit_run(
+    run_id: str,
+    commander_url: str = "http://127.0.0.1:8080",
+    mode: str = "sft",
+    priority: int = 0,
+    weight: float = 1.0,
+    gpu: str = typer.Option("", help="Required GPU type (empty: any)"),
+    gpu_count: int = 0,
+    hf_repo: str = "",
+    shared_secret: str = "",
+) -> None:
+    """Queue a run for workers that acquire without a run_id."""
+    spec = {"run_id": run_id, "mode": mode, "priority": priority, "weight": weight}
+    spec.update({"gpu": gpu or None, "gpu_count": gpu_count or None, "hf_repo": hf_repo or None})
+    headers = {"X-Relay-Secret": shared_secret} if shared_secret else {}
+    resp = requests.post(commander_url.rstrip("/") + "/api/runs/submit", json=spec, headers=headers, timeout=10)
+    resp.raise_for_status()
+    typer.echo(json.dumps(resp.json(), indent=2))
+
+
+@app.command()
+def export_state(state_path: str, out: str, backend: str = "") -> None:
+    """Export commander state (any backend) as JSON."""
+    from relay.commander_store import open_state_store
+
+    open_state_store(Path(state_path), backend or None).export_json(Path(out))
+
+
+@app.command()
+def import_state(state_path: str, source: str, backend: str = "") -> None:
+    """Replace commander state in `state_path` with the JSON in `source`."""
+    from relay.commander_store import open_state_store
+
+    open_state_store(Path(state_path), backend or None).import_json(Path(source))
+
+
 @app.command()
 def print_lium_command(
     template_id: str,
@@ -10,8 +10,23 @@ export RELAY_OUTPUT_DIR="${RUN_ROOT}/ckpt"
 export RELAY_RESUME_FROM="${RESUME_FROM}"
 
 if [[ -n "${SLIME_RL_CMD:-}" ]]; then
-  # Provide RELAY_OUTPUT_DIR / RELAY_RESUME_FROM to the command.
-  eval "${SLIME_RL_CMD}"
+  if [[ -n "${RELAY_RESUME_READY_FILE:-}" && "${SLIME_WAITS_FOR_RESUME_READY:-false}" != "true" ]]; then
+    # The command loads RELAY_RESUME_FROM as it starts, so the copy to local scratch must finish
+    # first and there is no copy/startup overlap. A trainer that waits on the ready file itself,
+    # after its own initialization, sets SLIME_WAITS_FOR_RESUME_READY=true to start right away.
+    deadline=$((SECONDS + ${RELAY_RESUME_READY_TIMEOUT_SEC:-1800}))
+    while [[ ! -f "${RELAY_RESUME_READY_FILE}" ]] && (( SECONDS < deadline )); do sleep 0.5; done
+    if [[ -f "${RELAY_RESUME_READY_FILE}" ]]; then
+      export RELAY_RESUME_FROM="$(cat "${RELAY_RESUME_READY_FILE}")"
+    else
+      echo "resume prefetch not ready after ${RELAY_RESUME_READY_TIMEOUT_SEC:-1800}s; loading from L1" >&2
+      export RELAY_RESUME_FROM="${RELAY_RESUME_L1:?RELAY_RESUME_L1 is required without a ready file}"
+    fi
+  fi
+  # Provide RELAY_OUTPUT_DIR / RELAY_RESUME_FROM to the command. The worker's SIGUSR1/SIGTERM go to
+  # this pid: exec replaces this shell, and bash -c execs the command's last simple command
+  # (`cd x && python ...` works). Wrapper scripts must `exec` the trainer themselves.
+  exec bash -c "${SLIME_RL_CMD}"
 else
-  python3 trainer_blackbox/mock_trainer.py --mode rl --max-steps "${MOCK_MAX_STEPS:-3}" --save-every 1 --staging-root "${STAGING_ROOT}"
+  exec python3 trainer_blackbox/mock_trainer.py --mode rl --max-steps "${MOCK_MAX_STEPS:-3}" --save-every 1 --staging-root "${STAGING_ROOT}"
 fi
@@ -2,16 +2,19 @@ from __future__ import annotations
 
 import argparse
 import json
+import os
 import signal
 import time
 from pathlib import Path
 
 STOP = False
+EMERGENCY = False
 
 
 def _on_usr1(_signum, _frame):
-    # Placeholder for signal-triggered checkpoint in real trainers.
-    return
+    # The relay worker asks for an emergency checkpoint when the pod is being preempted.
+    global EMERGENCY
+    EMERGENCY = True
 
 
 def _on_term(_signum, _frame):
@@ -31,6 +34,39 @@ def write_step(staging_root: Path, step: int, mode: str) -> None:
     (out / "metrics.json").write_text(json.dumps(metrics, indent=2), encoding="utf-8")
 
 
+def emergency_save(staging_root: Path, step: int, mode: str) -> None:
+    write_step(staging_root, step, mode)
+    marker = os.getenv("RELAY_EMERGENCY_MARKER")
+    if marker:
+        tmp = Path(marker).with_name(Path(marker).name + ".tmp")
+        tmp.write_text(f"step_{step:08d}", encoding="utf-8")
+        os.replace(tmp, marker)
+
+
+def wait_backpressure(timeout: float = 60.0) -> None:
+    # The relay worker keeps this file while its finalize queue is full.
+    marker = os.getenv("RELAY_CKPT_BACKPRESSURE_FILE")
+    if not marker:
+        return
+    end = time.time() + timeout
+    while Path(marker).exists() and time.time() < end and not STOP:
+        time.sleep(0.5)
+
+
+def wait_resume_ready() -> str:
+    # With local resume prefetch the worker copies the checkpoint while this process starts up.
+    resume_from = os.getenv("RELAY_RESUME_FROM", "")
+    ready = os.getenv("RELAY_RESUME_READY_FILE")
+    if not ready:
+        return resume_from
+    end = time.time() + float(os.getenv("RELAY_RESUME_READY_TIMEOUT_SEC", "1800"))
+    while not Path(ready).exists() and time.time() < end and not STOP:
+        time.sleep(0.2)
+    if Path(ready).exists():
+        return Path(ready).read_text(encoding="utf-8").strip()
+    return os.getenv("RELAY_RESUME_L1", resume_from)
+
+
 def main() -> int:
     parser = argparse.ArgumentParser()
     parser.add_argument("--mode", choices=["sft", "rl"], required=True)
@@ -40,13 +76,21 @@ def main() -> int:
     args = parser.parse_args()
 
     staging_root = Path(args.staging_root)
+    wait_resume_ready()
 
+    global EMERGENCY
     for step in range(1, args.max_steps + 1):
         if STOP:
             break
         if step % args.save_every == 0:
+            wait_backpressure()
             write_step(staging_root, step, args.mode)
-        time.sleep(1)
+        end = time.time() + 1
+        while time.time() < end and not STOP:
+            if EMERGENCY:
+                EMERGENCY = False
+                emergency_save(staging_root, step, args.mode)
+            time.sleep(0.1)
 
     return 0
 
@@ -0,0 +1,101 @@
+"""Micro-benchmark: adapter transcript accumulation, list joins vs TrajectoryBuilder.
+
+Replays the per-turn bookkeeping of `trainstack_plugins.http_env.adapter.generate` for a long
+multi-turn episode without any network or tokenizer cost. By default the transcript text is
+read every turn, as in text mode; `--input-ids` models TRAINSTACK_LLM_INPUT_IDS, where the old
+code still rebuilt it each turn and the builder only joins it once at the end.
+
+    python scripts/bench_http_env_trajectory.py --turns 64 --action-tokens 256 --obs-tokens 1024
+"""
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from trainstack_plugins.http_env.trajectory import TrajectoryBuilder  # noqa: E402
+
+
+def _episode(turns: int, action_tokens: int, obs_tokens: int):
+    prompt_ids = list(range(512))
+    action_ids = list(range(action_tokens))
+    action_log_probs = [-0.5] * action_tokens
+    obs_ids = list(range(obs_tokens))
+    return (
+        "p" * 2048,
+        prompt_ids,
+        "a" * action_tokens * 4,
+        action_ids,
+        action_log_probs,
+        "o" * obs_tokens * 4,
+        obs_ids,
+        turns,
+    )
+
+
+def run_lists(prompt_text, prompt_ids, action_text, action_ids, action_log_probs, obs_text, obs_ids, turns, read_text):
+    response_parts: list[str] = []
+    response_token_ids: list[int] = []
+    loss_mask: list[int] = []
+    rollout_log_probs: list[float] = []
+    # The adapter before TrajectoryBuilder rebuilt the text every turn, whatever it then sent.
+    del read_text
+    for _ in range(turns):
+        _ = prompt_text + "".join(response_parts)
+        response_parts.append(action_text)
+        response_token_ids.extend(action_ids)
+        loss_mask.extend([1] * len(action_ids))
+        rollout_log_probs.extend(action_log_probs)
+        response_parts.append(obs_text)
+        response_token_ids.extend(obs_ids)
+        loss_mask.extend([0] * len(obs_ids))
+        rollout_log_probs.extend([0.0] * len(obs_ids))
+    sample = SimpleNamespace()
+    sample.tokens = prompt_ids + response_token_ids
+    sample.response = "".join(response_parts)
+    sample.response_length = len(response_token_ids)
+    sample.loss_mask = loss_mask
+    sample.rollout_log_probs = rollout_log_probs
+    return sample
+
+
+def run_builder(
+    prompt_text, prompt_ids, action_text, action_ids, action_log_probs, obs_text, obs_ids, turns, read_text
+):
+    trajectory = TrajectoryBuilder(prompt_text, prompt_ids)
+    for _ in range(turns):
+        if read_text:
+            _ = trajectory.text
+        else:
+            _ = trajectory.input_ids()
+        trajectory.add_action(action_text, action_ids, action_log_probs)
+        trajectory.add_observation(obs_text, obs_ids)
+    sample = SimpleNamespace()
+    trajectory.fill(sample)
+    return sample
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=32)
+    parser.add_argument("--action-tokens", type=int, default=256)
+    parser.add_argument("--obs-tokens", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--input-ids", action="store_true", help="do not read the text every turn")
+    args = parser.parse_args()
+
+    episode = (*_episode(args.turns, args.action_tokens, args.obs_tokens), not args.input_ids)
+    expected, got = run_lists(*episode), run_builder(*episode)
+    assert vars(expected) == vars(got), "builder output differs from list-based output"
+
+    for name, fn in (("lists", run_lists), ("builder", run_builder)):
+        best = min(timeit.repeat(lambda: fn(*episode), number=1, repeat=args.repeat))
+        print(f"{name:>8}: {best * 1e3:8.3f} ms/episode")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
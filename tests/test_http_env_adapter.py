@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+pytest.importorskip("slime")
+
+from slime.utils.types import Sample  # noqa: E402
+
+from trainstack_plugins.http_env import adapter, mock_llm_server, server  # noqa: E402
+from trainstack_plugins.http_env.encoding import BatchEncoder  # noqa: E402
+from trainstack_plugins.http_env.env_client import EnvClient  # noqa: E402
+
+
+class _Tokenizer:
+    def __init__(self):
+        self.encoded: list[str] = []
+
+    def encode(self, text, add_special_tokens=False):
+        self.encoded.append(text)
+        return [ord(ch) for ch in text]
+
+
+def test_input_ids_mode_sends_and_records_generated_tokens_without_re_encoding(monkeypatch):
+    tokenizer = _Tokenizer()
+    monkeypatch.setattr(adapter, "_ENCODER", BatchEncoder(tokenizer))
+    monkeypatch.setenv("TRAINSTACK_LLM_INPUT_IDS", "1")
+    monkeypatch.setenv("TRAINSTACK_MOCK_LLM_TEXT", "<answer>42</answer>")
+    server.SESSIONS.clear()
+
+    llm = httpx.AsyncClient(transport=httpx.ASGITransport(app=mock_llm_server.app), base_url="http://llm")
+    env = EnvClient("http://env", transport=httpx.ASGITransport(app=server.app))
+    sent_ids = []
+
+    async def post(url, payload):
+        # input_ids is the trajectory's live buffer; copy it as it was when sent.
+        sent_ids.append(list(payload["input_ids"]))
+        return (await llm.post("/generate", json=payload)).json()
+
+    monkeypatch.setattr(adapter, "post", post)
+    monkeypatch.setattr(adapter, "_get_env_client", lambda args, env_base: env)
+    args = SimpleNamespace(
+        partial_rollout=False, rollout_max_response_len=64, sglang_router_ip="llm", sglang_router_port=0
+    )
+
+    async def main():
+        sample = await adapter.generate(args, Sample(prompt="q", label="42", metadata={}), {})
+        await env.aclose()
+        await llm.aclose()
+        return sample
+
+    sample = asyncio.run(main())
+    assert sample.status == Sample.Status.COMPLETED and sample.reward == 1.0
+
+    prompt_ids = [ord("q")]
+    start_obs, end_obs = tokenizer.encoded[1], tokenizer.encoded[2]
+    generated = [mock_llm_server.MOCK_TOKEN_BASE + ord(ch) for ch in "<answer>42</answer>"]
+    # The model's own ids are used for the action; only the prompt and observations are encoded.
+    assert tokenizer.encoded[0] == "q" and "<answer>42</answer>" not in tokenizer.encoded
+    assert sent_ids[0] == prompt_ids + [ord(ch) for ch in start_obs]
+    assert sample.tokens == sent_ids[0] + generated + [ord(ch) for ch in end_obs]
+    assert sample.response_length == len(sample.tokens) - len(prompt_ids)
+    assert sample.loss_mask == [0] * len(start_obs) + [1] * len(generated) + [0] * len(end_obs)
+    assert sample.rollout_log_probs[len(start_obs) : len(start_obs) + len(generated)] == [-0.5] * len(generated)
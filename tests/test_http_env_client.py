@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from trainstack_plugins.http_env import env_client
+from trainstack_plugins.http_env.env_client import EnvClient, default_pool_size
+
+
+class _Server:
+    """MockTransport handler that answers with queued statuses (then 200) and records each request."""
+
+    def __init__(self, *statuses: int | type[Exception]):
+        self.statuses = list(statuses)
+        self.requests: list[tuple[str, dict]] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append((request.url.path, json.loads(request.content)))
+        status = self.statuses.pop(0) if self.statuses else 200
+        if isinstance(status, type):
+            raise status("connection refused", request=request)
+        return httpx.Response(status, json={"ok": status == 200})
+
+    def client(self, **kwargs) -> EnvClient:
+        return EnvClient("http://env", retry_sleep_sec=0, transport=httpx.MockTransport(self), **kwargs)
+
+
+def test_post_retries_connection_errors_and_5xx():
+    server = _Server(httpx.ConnectError, 503, 502)
+
+    async def main():
+        client = server.client()
+        try:
+            return await client.post("/v1/session/start", {"task": {}})
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(main()) == {"ok": True}
+    assert len(server.requests) == 4
+
+
+def test_post_fails_fast_on_4xx_and_gives_up_after_max_retries():
+    server = _Server(422, 500, 500)
+
+    async def main():
+        client = server.client(max_retries=2)
+        try:
+            with pytest.raises(httpx.HTTPStatusError) as bad_request:
+                await client.post("/v1/session/step", {"session_id": "s"})
+            assert bad_request.value.response.status_code == 422
+            assert len(server.requests) == 1
+            with pytest.raises(httpx.HTTPStatusError) as server_error:
+                await client.post("/v1/session/step", {"session_id": "s"})
+            assert server_error.value.response.status_code == 500
+        finally:
+            await client.aclose()
+
+    asyncio.run(main())
+    assert len(server.requests) == 3
+
+
+def test_closes_are_flushed_in_one_batch():
+    server = _Server()
+
+    async def main():
+        client = server.client(batch=True, batch_window_sec=0.01)
+        for session_id in ("a", "b", "c"):
+            client.close_later(session_id)
+        await client.aclose()
+
+    asyncio.run(main())
+    assert server.requests == [
+        ("/v1/session/close_batch", {"requests": [{"session_id": "a"}, {"session_id": "b"}, {"session_id": "c"}]})
+    ]
+
+
+def test_unbatched_closes_are_sent_per_session_and_failures_ignored():
+    server = _Server(404)
+
+    async def main():
+        client = server.client(batch_window_sec=0.01)
+        client.close_later("a")
+        client.close_later("b")
+        await client.aclose()
+
+    asyncio.run(main())
+    # The 404 is not retried, so each session is closed exactly once.
+    assert sorted(server.requests, key=lambda req: req[1]["session_id"]) == [
+        ("/v1/session/close", {"session_id": "a"}),
+        ("/v1/session/close", {"session_id": "b"}),
+    ]
+
+
+def test_default_pool_size_matches_rollout_concurrency():
+    args = SimpleNamespace(sglang_server_concurrency=32, rollout_num_gpus=8, rollout_num_gpus_per_engine=2)
+    assert default_pool_size(args) == 128
+    assert default_pool_size(SimpleNamespace()) == 64
+    assert default_pool_size(SimpleNamespace(sglang_server_concurrency=0)) == 1
+
+
+def test_clients_are_cached_per_event_loop_and_closed():
+    async def main():
+        client = env_client.get_env_client("http://env", pool_size=4)
+        assert env_client.get_env_client("http://env") is client
+        await env_client.close_env_clients()
+        assert client._client.is_closed
+        return client
+
+    first = asyncio.run(main())
+    second = asyncio.run(main())
+    assert first is not second
+    assert not env_client._CLIENTS
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import asyncio
+
+from trainstack_plugins.http_env.encoding import BatchEncoder
+
+
+class _Tokenizer:
+    is_fast = True
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.batch_calls: list[list[str]] = []
+        self.encode_calls: list[str] = []
+
+    def __call__(self, texts, add_special_tokens=False):
+        self.batch_calls.append(list(texts))
+        if self.fail:
+            raise ValueError("tokenizer down")
+        return {"input_ids": [[len(text), ord(text[0])] for text in texts]}
+
+    def encode(self, text, add_special_tokens=False):
+        self.encode_calls.append(text)
+        if self.fail:
+            raise ValueError("tokenizer down")
+        return [len(text), ord(text[0])]
+
+
+def test_encode_batch_counts_hits_and_misses():
+    tok = _Tokenizer()
+    encoder = BatchEncoder(tok)
+
+    assert encoder.encode_batch(["ab", "c", "ab"]) == [[2, 97], [1, 99], [2, 97]]
+    # Duplicates within one call are encoded once.
+    assert tok.batch_calls == [["ab", "c"]]
+    assert (encoder.hits, encoder.misses) == (0, 2)
+
+    assert encoder.encode_batch(["c", "d"]) == [[1, 99], [1, 100]]
+    assert tok.encode_calls == ["d"]
+    assert (encoder.hits, encoder.misses) == (1, 3)
+
+
+def test_cache_evicts_least_recently_used():
+    tok = _Tokenizer()
+    encoder = BatchEncoder(tok, cache_size=2)
+
+    encoder.encode_batch(["a"])
+    encoder.encode_batch(["b"])
+    encoder.encode_batch(["a"])  # refresh "a", so "b" is now the oldest
+    encoder.encode_batch(["c"])
+    assert len(encoder._cache) == 2
+
+    tok.encode_calls.clear()
+    encoder.encode_batch(["a"])
+    encoder.encode_batch(["b"])
+    assert tok.encode_calls == ["b"]
+
+
+def test_cache_size_zero_disables_caching():
+    tok = _Tokenizer()
+    encoder = BatchEncoder(tok, cache_size=0)
+
+    encoder.encode_batch(["a"])
+    encoder.encode_batch(["a"])
+    assert tok.encode_calls == ["a", "a"]
+    assert encoder.hits == 0 and not encoder._cache
+
+
+def test_concurrent_encodes_share_one_tokenizer_call():
+    tok = _Tokenizer()
+    encoder = BatchEncoder(tok)
+
+    async def main():
+        return await asyncio.gather(encoder.encode("xy"), encoder.encode("z"), encoder.encode("xy"))
+
+    assert asyncio.run(main()) == [[2, 120], [1, 122], [2, 120]]
+    # Both samples asking for "xy" wait on the same pending future.
+    assert tok.batch_calls == [["xy", "z"]]
+    assert encoder.misses == 2
+
+    async def again():
+        return await encoder.encode("z")
+
+    assert asyncio.run(again()) == [1, 122]
+    assert encoder.hits == 1 and len(tok.batch_calls) == 1
+
+
+def test_flush_error_fails_every_waiter_and_caches_nothing():
+    tok = _Tokenizer(fail=True)
+    encoder = BatchEncoder(tok)
+
+    async def main():
+        return await asyncio.gather(encoder.encode("a"), encoder.encode("b"), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert not encoder._cache and not encoder._pending
+
+    tok.fail = False
+    assert encoder.encode_batch(["a"]) == [[1, 97]]
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from trainstack_plugins.http_env import server
+from trainstack_plugins.http_env.batch import run_batch
+from trainstack_plugins.http_env.session_batch import SessionBatcher
+
+
+class _Env:
+    """Fake env server: answers `<kind>_batch` with one result per request, or a canned response."""
+
+    def __init__(self, response=None):
+        self.response = response
+        self.calls: list[tuple[str, list[dict]]] = []
+
+    async def post(self, path, payload):
+        self.calls.append((path, payload["requests"]))
+        if self.response is not None:
+            return self.response
+        results = []
+        for req in payload["requests"]:
+            if req.get("fail"):
+                results.append({"ok": False, "status_code": 404, "detail": "session not found"})
+            else:
+                results.append({"ok": True, "result": {"echo": req["i"]}})
+        return {"results": results}
+
+
+def test_batcher_splits_at_max_batch():
+    env = _Env()
+    batcher = SessionBatcher(env.post, window_sec=0.01, max_batch=2)
+
+    async def main():
+        return await asyncio.gather(*(batcher.call("step", {"i": i}) for i in range(5)))
+
+    assert asyncio.run(main()) == [{"echo": i} for i in range(5)]
+    assert [path for path, _ in env.calls] == ["/v1/session/step_batch"] * 3
+    assert [len(reqs) for _, reqs in env.calls] == [2, 2, 1]
+
+
+def test_batcher_fails_only_the_failed_item():
+    env = _Env()
+    batcher = SessionBatcher(env.post, window_sec=0.01)
+
+    async def main():
+        calls = [batcher.call("step", {"i": 0}), batcher.call("step", {"i": 1, "fail": True})]
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    ok, failed = asyncio.run(main())
+    assert ok == {"echo": 0}
+    assert isinstance(failed, RuntimeError) and "(404): session not found" in str(failed)
+    assert len(env.calls) == 1
+
+
+def test_batcher_fails_every_caller_on_result_count_mismatch():
+    env = _Env(response={"results": [{"ok": True, "result": {}}]})
+    batcher = SessionBatcher(env.post, window_sec=0.01)
+
+    async def main():
+        calls = [batcher.call("start", {"i": i}) for i in range(3)]
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) and "1 results for 3 requests" in str(r) for r in results)
+
+
+@pytest.fixture()
+def client():
+    server.SESSIONS.clear()
+    with TestClient(server.app) as c:
+        yield c
+    server.SESSIONS.clear()
+
+
+def test_batch_endpoints_report_items_independently(client):
+    tasks = [{"task": {"prompt": "q", "label": "42"}}, {"task": {"prompt": "q", "label": "7"}}]
+    started = client.post("/v1/session/start_batch", json={"requests": tasks}).json()["results"]
+    assert [r["ok"] for r in started] == [True, True]
+    ids = [r["result"]["session_id"] for r in started]
+
+    steps = [
+        {"session_id": ids[0], "action": "<answer>42</answer>"},
+        {"session_id": "missing", "action": "x"},
+        {"session_id": ids[1], "action": "<answer>0</answer>"},
+    ]
+    stepped = client.post("/v1/session/step_batch", json={"requests": steps}).json()["results"]
+    assert stepped[0]["ok"] and stepped[0]["result"]["reward"] == 1.0
+    assert stepped[1] == {"ok": False, "status_code": 404, "detail": "session not found"}
+    assert stepped[2]["ok"] and stepped[2]["result"]["reward"] == 0.0
+
+    closes = {"requests": [{"session_id": session_id} for session_id in ids]}
+    closed = client.post("/v1/session/close_batch", json=closes).json()["results"]
+    assert closed == [{"ok": True, "result": {"ok": True}}] * 2
+    assert not server.SESSIONS
+
+
+def test_run_batch_maps_unexpected_errors_to_500():
+    async def handler(req):
+        if req == "boom":
+            raise ValueError("boom")
+        return {"echo": req}
+
+    out = asyncio.run(run_batch(handler, ["a", "boom"]))
+    assert out == {
+        "results": [{"ok": True, "result": {"echo": "a"}}, {"ok": False, "status_code": 500, "detail": "boom"}]
+    }
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+from trainstack_plugins.http_env.trajectory import TrajectoryBuilder
+
+
+def test_tokens_mask_and_logprobs_stay_aligned_across_turns():
+    trajectory = TrajectoryBuilder("P:", [1, 2])
+    trajectory.add_observation("o1", [10])
+    trajectory.add_action("a1", [20, 21], [-0.1, -0.2])
+    trajectory.add_observation("o2", [30, 31])
+    trajectory.add_action("a2", [40])
+
+    assert trajectory.input_ids() == [1, 2, 10, 20, 21, 30, 31, 40]
+    assert trajectory.response_length == 6
+
+    sample = SimpleNamespace()
+    trajectory.fill(sample)
+    assert sample.tokens == [1, 2, 10, 20, 21, 30, 31, 40]
+    assert sample.loss_mask == [0, 1, 1, 0, 0, 1]
+    # Observations and actions without logprobs are padded with zeros.
+    assert sample.rollout_log_probs == [0.0, -0.1, -0.2, 0.0, 0.0, 0.0]
+    assert sample.response == "o1a1o2a2"
+    assert sample.response_length == len(sample.loss_mask) == len(sample.rollout_log_probs)
+
+
+def test_text_is_joined_lazily_and_cached_until_the_next_part():
+    trajectory = TrajectoryBuilder("P:", [1])
+    assert trajectory.text == "P:"
+
+    trajectory.add_action("a1", [2])
+    trajectory.add_observation("o1", [3])
+    text = trajectory.text
+    assert text == "P:a1o1"
+    assert trajectory.text is text
+
+    trajectory.add_action("a2", [4])
+    assert trajectory.text == "P:a1o1a2"
+    assert trajectory.response_text == "a1o1a2"
+
+
+def test_empty_episode_fills_an_empty_response():
+    trajectory = TrajectoryBuilder("P:", [1, 2])
+    sample = SimpleNamespace()
+    trajectory.fill(sample)
+    assert sample.tokens == [1, 2]
+    assert (sample.response, sample.response_length, sample.loss_mask) == ("", 0, [])
+    assert sample.rollout_log_probs is None
@@ -3,10 +3,15 @@ from typing import TYPE_CHECKING, Any
 
 from slime.utils.http_utils import post
 
+from trainstack_plugins.http_env.encoding import BatchEncoder
+from trainstack_plugins.http_env.env_client import EnvClient, default_pool_size, get_env_client
+from trainstack_plugins.http_env.trajectory import TrajectoryBuilder
+
 if TYPE_CHECKING:
     from slime.utils.types import Sample
 
 _TOKENIZER = None
+_ENCODER = None
 
 
 class _FallbackTokenizer:
@@ -27,6 +32,28 @@ def _get_tokenizer(args):
     return _TOKENIZER
 
 
+def _get_encoder(args) -> BatchEncoder:
+    global _ENCODER
+    if _ENCODER is None:
+        _ENCODER = BatchEncoder(
+            _get_tokenizer(args),
+            cache_size=int(os.getenv("TRAINSTACK_ENCODE_CACHE_SIZE", "4096")),
+            window_sec=float(os.getenv("TRAINSTACK_ENCODE_BATCH_MS", "0")) / 1000,
+        )
+    return _ENCODER
+
+
+def _get_env_client(args, env_base: str) -> EnvClient:
+    return get_env_client(
+        env_base,
+        pool_size=int(os.getenv("TRAINSTACK_HTTP_ENV_POOL_SIZE", str(default_pool_size(args)))),
+        # Batching needs the env server's /v1/session/*_batch endpoints, so it is opt-in.
+        batch=os.getenv("TRAINSTACK_HTTP_ENV_BATCH", "0").lower() in {"1", "true", "yes"},
+        batch_window_sec=float(os.getenv("TRAINSTACK_HTTP_ENV_BATCH_MS", "5")) / 1000,
+        batch_max=int(os.getenv("TRAINSTACK_HTTP_ENV_BATCH_MAX", "256")),
+    )
+
+
 def _prompt_to_text(prompt: str | list[dict[str, Any]]) -> str:
     if isinstance(prompt, str):
         return prompt
@@ -58,18 +85,19 @@ async def generate(args, sample: "Sample", sampling_params: dict[str, Any], eval
     if args.partial_rollout:
         raise RuntimeError("partial_rollout is not supported in trainstack_plugins.http_env.adapter.generate")
 
-    tokenizer = _get_tokenizer(args)
+    encoder = _get_encoder(args)
     prompt_text = _prompt_to_text(sample.prompt)
-    prompt_token_ids = tokenizer.encode(prompt_text, add_special_tokens=False)
+    prompt_token_ids = await encoder.encode(prompt_text)
 
     env_base = os.getenv("TRAINSTACK_HTTP_ENV_URL", "http://127.0.0.1:18080").rstrip("/")
     llm_url = os.getenv("TRAINSTACK_LLM_URL", f"http://{args.sglang_router_ip}:{args.sglang_router_port}/generate")
+    env = _get_env_client(args, env_base)
     max_turns = int(os.getenv("TRAINSTACK_HTTP_ENV_MAX_TURNS", "8"))
+    # Token-in/token-out: send the accumulated token ids so the server neither re-tokenizes the
+    # transcript nor drifts from the ids recorded in the sample.
+    send_input_ids = os.getenv("TRAINSTACK_LLM_INPUT_IDS", "0").lower() in {"1", "true", "yes"}
 
-    response_parts: list[str] = []
-    response_token_ids: list[int] = []
-    loss_mask: list[int] = []
-    rollout_log_probs: list[float] = []
+    trajectory = TrajectoryBuilder(prompt_text, prompt_token_ids)
     generated_token_budget = int(sampling_params.get("max_new_tokens", args.rollout_max_response_len))
     generated_token_count = 0
 
@@ -78,8 +106,8 @@ async def generate(args, sample: "Sample", sampling_params: dict[str, Any], eval
     finish_reason = "stop"
 
     try:
-        start_resp = await post(
-            f"{env_base}/v1/session/start",
+        start_resp = await env.session(
+            "start",
             {
                 "task": {
                     "prompt": prompt_text,
@@ -96,11 +124,7 @@ async def generate(args, sample: "Sample", sampling_params: dict[str, Any], eval
         init_obs = start_resp.get("observation")
         if init_obs:
             obs_text = str(init_obs)
-            obs_ids = tokenizer.encode(obs_text, add_special_tokens=False)
-            response_parts.append(obs_text)
-            response_token_ids.extend(obs_ids)
-            loss_mask.extend([0] * len(obs_ids))
-            rollout_log_probs.extend([0.0] * len(obs_ids))
+            trajectory.add_observation(obs_text, await encoder.encode(obs_text))
 
         turn = 0
         while not done and turn < max_turns:
@@ -113,14 +137,12 @@ async def generate(args, sample: "Sample", sampling_params: dict[str, Any], eval
             req_sampling_params = dict(sampling_params)
             req_sampling_params["max_new_tokens"] = remaining
 
-            gen_output = await post(
-                llm_url,
-                {
-                    "text": prompt_text + "".join(response_parts),
-                    "sampling_params": req_sampling_params,
-                    "return_logprob": True,
-                },
-            )
+            gen_payload = {"sampling_params": req_sampling_params, "return_logprob": True}
+            if send_input_ids:
+                gen_payload["input_ids"] = trajectory.input_ids()
+            else:
+                gen_payload["text"] = trajectory.text
+            gen_output = await post(llm_url, gen_payload)
 
             meta_info = gen_output.get("meta_info", {})
             finish_type = meta_info.get("finish_reason", {}).get("type", "stop")
@@ -136,21 +158,19 @@ async def generate(args, sample: "Sample", sampling_params: dict[str, Any], eval
                 action_token_ids = [item[1] for item in output_token_logprobs]
                 action_log_probs = [float(item[0]) for item in output_token_logprobs]
             else:
-                action_token_ids = tokenizer.encode(action_text, add_special_tokens=False)
-                action_log_probs = [0.0] * len(action_token_ids)
+                # Actions are rarely repeated; keep them out of the encode cache.
+                action_token_ids = encoder.tokenizer.encode(action_text, add_special_tokens=False)
+                action_log_probs = None
 
             generated_token_count += len(action_token_ids)
-            response_parts.append(action_text)
-            response_token_ids.extend(action_token_ids)
-            loss_mask.extend([1] * len(action_token_ids))
-            rollout_log_probs.extend(action_log_probs)
+            trajectory.add_action(action_text, action_token_ids, action_log_probs)
 
             if finish_type == "length":
                 finish_reason = "length"
                 break
 
-            step_resp = await post(
-                f"{env_base}/v1/session/step",
+            step_resp = await env.session(
+                "step",
                 {
                     "session_id": session_id,
                     "action": action_text,
@@ -163,23 +183,15 @@ async def generate(args, sample: "Sample", sampling_params: dict[str, Any], eval
             obs = step_resp.get("observation")
             if obs:
                 obs_text = str(obs)
-                obs_ids = tokenizer.encode(obs_text, add_special_tokens=False)
-                response_parts.append(obs_text)
-                response_token_ids.extend(obs_ids)
-                loss_mask.extend([0] * len(obs_ids))
-                rollout_log_probs.extend([0.0] * len(obs_ids))
+                trajectory.add_observation(obs_text, await encoder.encode(obs_text))
 
         if turn >= max_turns and not done:
             finish_reason = "length"
 
         if last_reward is None:
-            last_reward = _reward_from_label("".join(response_parts), sample.label)
+            last_reward = _reward_from_label(trajectory.response_text, sample.label)
 
-        sample.tokens = prompt_token_ids + response_token_ids
-        sample.response = "".join(response_parts)
-        sample.response_length = len(response_token_ids)
-        sample.loss_mask = loss_mask
-        sample.rollout_log_probs = rollout_log_probs if rollout_log_probs else None
+        trajectory.fill(sample)
         sample.reward = float(last_reward)
         if finish_reason == "length":
             sample.status = type(sample).Status.TRUNCATED
@@ -194,9 +206,6 @@ async def generate(args, sample: "Sample", sampling_params: dict[str, Any], eval
         sample.metadata["http_env_error"] = str(exc)
     finally:
         if session_id is not None:
-            try:
-                await post(f"{env_base}/v1/session/close", {"session_id": session_id})
-            except Exception:
-                pass
+            env.close_later(session_id)
 
     return sample
@@ -0,0 +1,64 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel, Field
+
+
+class StartRequest(BaseModel):
+    task: dict[str, Any] = Field(default_factory=dict)
+
+
+class StepRequest(BaseModel):
+    session_id: str
+    action: str
+
+
+class CloseRequest(BaseModel):
+    session_id: str
+
+
+class StartBatchRequest(BaseModel):
+    requests: list[StartRequest]
+
+
+class StepBatchRequest(BaseModel):
+    requests: list[StepRequest]
+
+
+class CloseBatchRequest(BaseModel):
+    requests: list[CloseRequest]
+
+
+Handler = Callable[[Any], Awaitable[dict[str, Any]]]
+
+
+async def run_batch(handler: Handler, requests: list[BaseModel]) -> dict[str, Any]:
+    # Items fail independently: each result is {"ok": true, "result": ...} or an HTTP-style error.
+    outs = await asyncio.gather(*(handler(req) for req in requests), return_exceptions=True)
+    results = []
+    for out in outs:
+        if isinstance(out, HTTPException):
+            results.append({"ok": False, "status_code": out.status_code, "detail": out.detail})
+        elif isinstance(out, Exception):
+            results.append({"ok": False, "status_code": 500, "detail": str(out)})
+        else:
+            results.append({"ok": True, "result": out})
+    return {"results": results}
+
+
+def add_batch_routes(app: FastAPI, start: Handler, step: Handler, close: Handler) -> None:
+    """Serve `/v1/session/{start,step,close}_batch` on `app` through the single-session handlers."""
+
+    @app.post("/v1/session/start_batch")
+    async def start_session_batch(req: StartBatchRequest) -> dict[str, Any]:
+        return await run_batch(start, req.requests)
+
+    @app.post("/v1/session/step_batch")
+    async def step_session_batch(req: StepBatchRequest) -> dict[str, Any]:
+        return await run_batch(step, req.requests)
+
+    @app.post("/v1/session/close_batch")
+    async def close_session_batch(req: CloseBatchRequest) -> dict[str, Any]:
+        return await run_batch(close, req.requests)
@@ -0,0 +1,93 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any
+
+
+def _text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class BatchEncoder:
+    """Tokenizer front-end with a bounded LRU cache and cross-sample batching.
+
+    Prompts and environment boilerplate repeat across a rollout batch, so encodings are cached by
+    a digest of the text. Misses from concurrent samples are collected for `window_sec` (0 = until
+    the event loop's next iteration) and encoded with one batch call on fast tokenizers.
+    Returned id lists are shared with the cache and must not be mutated.
+    """
+
+    def __init__(self, tokenizer: Any, cache_size: int = 4096, window_sec: float = 0.0):
+        self.tokenizer = tokenizer
+        self.cache_size = cache_size
+        self.window_sec = window_sec
+        self._cache: OrderedDict[bytes, list[int]] = OrderedDict()
+        self._pending: dict[bytes, tuple[str, asyncio.Future]] = {}
+        self._flush_handle: asyncio.Handle | None = None
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key: bytes) -> list[int] | None:
+        ids = self._cache.get(key)
+        if ids is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+        return ids
+
+    def _store(self, key: bytes, ids: list[int]) -> None:
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = ids
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _encode_many(self, texts: list[str]) -> list[list[int]]:
+        self.misses += len(texts)
+        if len(texts) > 1 and getattr(self.tokenizer, "is_fast", False):
+            return list(self.tokenizer(texts, add_special_tokens=False)["input_ids"])
+        return [self.tokenizer.encode(text, add_special_tokens=False) for text in texts]
+
+    def encode_batch(self, texts: list[str]) -> list[list[int]]:
+        """Encode `texts` in one tokenizer call for the cache misses."""
+        keys = [_text_key(text) for text in texts]
+        out = [self._lookup(key) for key in keys]
+        missing = {key: text for key, text, ids in zip(keys, texts, out) if ids is None}
+        if missing:
+            for key, ids in zip(missing, self._encode_many(list(missing.values()))):
+                self._store(key, ids)
+                missing[key] = ids
+            out = [ids if ids is not None else missing[key] for key, ids in zip(keys, out)]
+        return out
+
+    async def encode(self, text: str) -> list[int]:
+        key = _text_key(text)
+        ids = self._lookup(key)
+        if ids is not None:
+            return ids
+        pending = self._pending.get(key)
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            pending = self._pending[key] = (text, loop.create_future())
+            if self._flush_handle is None:
+                if self.window_sec > 0:
+                    self._flush_handle = loop.call_later(self.window_sec, self._flush)
+                else:
+                    self._flush_handle = loop.call_soon(self._flush)
+        # Shielded so one cancelled sample does not fail the others waiting on the same text.
+        return await asyncio.shield(pending[1])
+
+    def _flush(self) -> None:
+        self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        try:
+            encoded = self._encode_many([text for text, _ in pending.values()])
+        except Exception as exc:
+            for _, fut in pending.values():
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+        for (key, (_, fut)), ids in zip(pending.items(), encoded):
+            self._store(key, ids)
+            if not fut.done():
+                fut.set_result(ids)
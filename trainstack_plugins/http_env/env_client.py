@@ -0,0 +1,133 @@
+import asyncio
+import atexit
+import weakref
+from typing import Any
+
+import httpx
+
+from trainstack_plugins.http_env.session_batch import SessionBatcher
+
+
+def default_pool_size(args) -> int:
+    """The concurrency slime allows towards the rollout engines, so no sample queues for a connection."""
+    concurrency = getattr(args, "sglang_server_concurrency", 64) * getattr(args, "rollout_num_gpus", 1)
+    return max(1, concurrency // max(1, getattr(args, "rollout_num_gpus_per_engine", 1)))
+
+
+class EnvClient:
+    """Keep-alive connection pool to one environment server.
+
+    Session calls go straight to `/v1/session/{kind}` or through a `SessionBatcher`. As with slime's
+    shared `post` helper, connection errors and 5xx answers are retried up to `max_retries` times,
+    `retry_sleep_sec` apart; a 4xx is the request's fault and fails at once. Closes are
+    fire-and-forget: `close_later` queues the id and a background task flushes the queue in
+    batches, so no sample waits a round trip for a result nobody reads.
+    """
+
+    def __init__(
+        self,
+        env_base: str,
+        pool_size: int = 64,
+        batch: bool = False,
+        batch_window_sec: float = 0.005,
+        batch_max: int = 256,
+        max_retries: int = 60,
+        retry_sleep_sec: float = 1.0,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.env_base = env_base.rstrip("/")
+        self.batch_window_sec = batch_window_sec
+        self.batch_max = batch_max
+        self.max_retries = max_retries
+        self.retry_sleep_sec = retry_sleep_sec
+        self._client = httpx.AsyncClient(
+            base_url=self.env_base,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(None),
+            transport=transport,
+        )
+        self._batcher = SessionBatcher(self.post, batch_window_sec, batch_max) if batch else None
+        self._closing: list[str] = []
+        self._close_task: asyncio.Task | None = None
+
+    async def post(self, path: str, payload: dict[str, Any]) -> dict[str, Any]:
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                resp = await self._client.post(path, json=payload)
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                if resp.status_code < 500 or attempt >= self.max_retries:
+                    resp.raise_for_status()
+                    return resp.json()
+            await asyncio.sleep(self.retry_sleep_sec)
+        raise RuntimeError(f"request failed: {self.env_base}{path}")
+
+    async def session(self, kind: str, payload: dict[str, Any]) -> dict[str, Any]:
+        if self._batcher is not None:
+            return await self._batcher.call(kind, payload)
+        return await self.post(f"/v1/session/{kind}", payload)
+
+    def close_later(self, session_id: str) -> None:
+        self._closing.append(session_id)
+        if self._close_task is None or self._close_task.done():
+            self._close_task = asyncio.get_running_loop().create_task(self._flush_closes())
+
+    async def _flush_closes(self) -> None:
+        # Give samples finishing together a moment to land in the same flush.
+        await asyncio.sleep(self.batch_window_sec)
+        while self._closing:
+            ids, self._closing = self._closing[: self.batch_max], self._closing[self.batch_max :]
+            requests = [{"session_id": session_id} for session_id in ids]
+            try:
+                if self._batcher is not None:
+                    await self.post("/v1/session/close_batch", {"requests": requests})
+                else:
+                    closes = (self.post("/v1/session/close", req) for req in requests)
+                    await asyncio.gather(*closes, return_exceptions=True)
+            except Exception:
+                pass
+
+    async def aclose(self) -> None:
+        if self._close_task is not None:
+            await self._close_task
+        await self._client.aclose()
+
+
+# httpx pools are bound to the event loop they were created on, so clients are cached per loop.
+_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, EnvClient]]" = weakref.WeakKeyDictionary()
+
+
+def get_env_client(env_base: str, **kwargs) -> EnvClient:
+    """The running loop's client for `env_base`, created with `kwargs` on first use."""
+    clients = _CLIENTS.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(env_base)
+    if client is None:
+        client = clients[env_base] = EnvClient(env_base, **kwargs)
+    return client
+
+
+async def _aclose_all(clients: dict[str, EnvClient]) -> None:
+    await asyncio.gather(*(client.aclose() for client in clients.values()), return_exceptions=True)
+
+
+async def close_env_clients() -> None:
+    """Flush queued closes and close the running loop's clients."""
+    await _aclose_all(_CLIENTS.pop(asyncio.get_running_loop(), {}))
+
+
+@atexit.register
+def _close_at_exit() -> None:
+    # Rollouts run on a long-lived loop that is still alive (often in a daemon thread) at exit.
+    for loop, clients in list(_CLIENTS.items()):
+        if loop.is_closed():
+            continue
+        try:
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(_aclose_all(clients), loop).result(timeout=10)
+            else:
+                loop.run_until_complete(_aclose_all(clients))
+        except Exception:
+            pass
+    _CLIENTS.clear()
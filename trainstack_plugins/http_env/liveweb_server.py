@@ -5,22 +5,10 @@ from dataclasses import dataclass
 from typing import Any
 
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
 
-app = FastAPI(title="Trainstack LiveWeb HTTP Environment", version="0.1.0")
-
-
-class StartRequest(BaseModel):
-    task: dict[str, Any] = Field(default_factory=dict)
-
-
-class StepRequest(BaseModel):
-    session_id: str
-    action: str
+from trainstack_plugins.http_env.batch import CloseRequest, StartRequest, StepRequest, add_batch_routes
 
-
-class CloseRequest(BaseModel):
-    session_id: str
+app = FastAPI(title="Trainstack LiveWeb HTTP Environment", version="0.1.0")
 
 
 @dataclass
@@ -144,6 +132,9 @@ async def close_session(req: CloseRequest) -> dict[str, Any]:
     return {"ok": True}
 
 
+add_batch_routes(app, start_session, step_session, close_session)
+
+
 if __name__ == "__main__":
     import uvicorn
 
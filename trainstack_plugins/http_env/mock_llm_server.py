@@ -6,9 +6,12 @@ from pydantic import BaseModel, Field
 
 app = FastAPI(title="Trainstack Mock LLM", version="0.1.0")
 
+MOCK_TOKEN_BASE = 100_000
+
 
 class GenerateRequest(BaseModel):
-    text: str
+    text: str | None = None
+    input_ids: list[int] | None = None
     sampling_params: dict[str, Any] = Field(default_factory=dict)
     return_logprob: bool = False
 
@@ -19,14 +22,14 @@ async def health() -> dict[str, str]:
 
 
 @app.post("/generate")
-async def generate(_: GenerateRequest) -> dict[str, Any]:
+async def generate(req: GenerateRequest) -> dict[str, Any]:
     text = os.getenv("TRAINSTACK_MOCK_LLM_TEXT", "<answer>42</answer>\n")
-    return {
-        "text": text,
-        "meta_info": {
-            "finish_reason": {"type": "stop"},
-        },
-    }
+    meta_info: dict[str, Any] = {"finish_reason": {"type": "stop"}}
+    if req.return_logprob:
+        # Token-out like sglang: one (logprob, token_id, token_text) entry per generated token. Here
+        # that is one token per character, offset so the ids stand out from locally encoded ones.
+        meta_info["output_token_logprobs"] = [[-0.5, MOCK_TOKEN_BASE + ord(ch), None] for ch in text]
+    return {"text": text, "meta_info": meta_info}
 
 
 if __name__ == "__main__":
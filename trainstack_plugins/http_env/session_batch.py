@@ -0,0 +1,69 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+SESSION_KINDS = ("start", "step", "close")
+
+
+class SessionBatcher:
+    """Coalesces concurrent samples' session calls into `/v1/session/{kind}_batch` requests.
+
+    Calls of one kind arriving within `window_sec` (or until `max_batch` are queued) share one
+    round trip, so a rollout batch costs O(turns) environment requests instead of
+    O(samples x turns). A failed item raises only in the sample that sent it.
+    """
+
+    def __init__(
+        self,
+        post: Callable[[str, dict[str, Any]], Awaitable[dict[str, Any]]],
+        window_sec: float = 0.005,
+        max_batch: int = 256,
+    ):
+        self.post = post
+        self.window_sec = window_sec
+        self.max_batch = max_batch
+        self._queues: dict[str, list[tuple[dict[str, Any], asyncio.Future]]] = {kind: [] for kind in SESSION_KINDS}
+        self._handles: dict[str, asyncio.Handle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def call(self, kind: str, payload: dict[str, Any]) -> dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        queue = self._queues[kind]
+        queue.append((payload, fut))
+        if len(queue) >= self.max_batch:
+            self._flush(kind)
+        elif kind not in self._handles:
+            self._handles[kind] = loop.call_later(self.window_sec, self._flush, kind)
+        return await fut
+
+    def _flush(self, kind: str) -> None:
+        handle = self._handles.pop(kind, None)
+        if handle is not None:
+            handle.cancel()
+        items, self._queues[kind] = self._queues[kind], []
+        if not items:
+            return
+        task = asyncio.get_running_loop().create_task(self._send(kind, items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, kind: str, items: list[tuple[dict[str, Any], asyncio.Future]]) -> None:
+        try:
+            resp = await self.post(f"/v1/session/{kind}_batch", {"requests": [p for p, _ in items]})
+            results = resp["results"]
+            if len(results) != len(items):
+                raise RuntimeError(f"{kind}_batch returned {len(results)} results for {len(items)} requests")
+        except Exception as exc:
+            for _, fut in items:
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+        for (_, fut), result in zip(items, results):
+            if fut.done():
+                continue
+            if result.get("ok"):
+                fut.set_result(result["result"])
+            else:
+                detail = f"({result.get('status_code')}): {result.get('detail')}"
+                fut.set_exception(RuntimeError(f"session {kind} failed {detail}"))
@@ -0,0 +1,68 @@
+from itertools import repeat
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from slime.utils.types import Sample
+
+
+class TrajectoryBuilder:
+    """Accumulates a multi-turn episode as flat token/mask/logprob buffers plus text chunks.
+
+    The buffers are the lists handed to the `Sample`, so `fill` copies nothing. The transcript is
+    kept as a list of chunks and only joined when read: once per turn in text mode, where the LLM
+    needs it, and just once in `fill` in token-in/token-out mode.
+    """
+
+    __slots__ = ("_parts", "_joined", "_prompt_len", "_tokens", "_loss_mask", "_log_probs")
+
+    def __init__(self, prompt_text: str, prompt_token_ids: list[int]):
+        self._parts = [prompt_text]
+        self._joined: str | None = prompt_text
+        self._prompt_len = len(prompt_token_ids)
+        self._tokens = list(prompt_token_ids)
+        self._loss_mask: list[int] = []
+        self._log_probs: list[float] = []
+
+    def add_observation(self, text: str, token_ids: list[int]) -> None:
+        self._parts.append(text)
+        self._joined = None
+        self._tokens.extend(token_ids)
+        # Observations are masked out with zero logprobs.
+        self._loss_mask.extend(repeat(0, len(token_ids)))
+        self._log_probs.extend(repeat(0.0, len(token_ids)))
+
+    def add_action(self, text: str, token_ids: list[int], log_probs: list[float] | None = None) -> None:
+        self._parts.append(text)
+        self._joined = None
+        self._tokens.extend(token_ids)
+        self._loss_mask.extend(repeat(1, len(token_ids)))
+        if log_probs is None:
+            self._log_probs.extend(repeat(0.0, len(token_ids)))
+        else:
+            self._log_probs.extend(log_probs)
+
+    @property
+    def text(self) -> str:
+        """Prompt plus every response part added so far."""
+        if self._joined is None:
+            self._joined = "".join(self._parts)
+        return self._joined
+
+    @property
+    def response_text(self) -> str:
+        return "".join(self._parts[1:])
+
+    @property
+    def response_length(self) -> int:
+        return len(self._tokens) - self._prompt_len
+
+    def input_ids(self) -> list[int]:
+        """Prompt plus response token ids; the live buffer, so callers must not mutate it."""
+        return self._tokens
+
+    def fill(self, sample: "Sample") -> None:
+        sample.tokens = self._tokens
+        sample.response = self.response_text
+        sample.response_length = self.response_length
+        sample.loss_mask = self._loss_mask
+        sample.rollout_log_probs = self._log_probs if self._log_probs else None